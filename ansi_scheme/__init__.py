@@ -1 +1,9 @@
-from .cli import cli
+def __getattr__(name):
+    # Importing the package shouldn't pull in click; commands load lazily.
+    if name == 'cli':
+        from .cli import cli
+        return cli
+    if name in ('Scheme', 'Style'):
+        from . import scheme
+        return getattr(scheme, name)
+    raise AttributeError(name)
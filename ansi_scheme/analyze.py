@@ -0,0 +1,121 @@
+import os
+import json
+
+import click
+
+from .constants import *
+from .inherit import extend
+from .load import _resolve_colors, _resolve_style
+from . import color
+
+def _iter_scheme_files(directories):
+    """Yields (name, path) for each scheme file in `directories`."""
+    for directory in directories:
+        for entry in os.scandir(directory):
+            if entry.name.endswith(EXT) and entry.is_file():
+                yield os.path.splitext(entry.name)[0], entry.path
+
+def _style_names(scheme):
+    names = set(DEFAULT_STYLES)
+    names.update(scheme.get('styles', {}))
+    return sorted(names)
+
+def _resolve_palette(scheme, defaults=None):
+    """Returns resolved colors with the slots a scheme leaves out filled in
+    from the terminal defaults."""
+    colors = dict(defaults or _resolve_colors(DEFAULT_SCHEME))
+    colors.update(_resolve_colors(scheme))
+    return colors
+
+def analyze_schemes(schemes, space='lab', distances=False):
+    """Returns scheme names, per-style contrast rows and, if `distances`,
+    each scheme's (index, Delta E) nearest other scheme (see
+    `color.nearest_delta_e`).
+
+    `schemes` is a list of (name, scheme dict). Every palette is parsed
+    once into rows, and all rows are converted in a single batch."""
+    defaults = _resolve_colors(DEFAULT_SCHEME)
+    names, palettes, rows = [], [], []
+    for name, scheme in schemes:
+        colors = _resolve_palette(scheme, defaults)
+        names.append(name)
+        palettes.append((scheme, colors))
+        rows.extend(color.palette_rows(colors, defaults))
+
+    # One pass over every color of every scheme.
+    luminance = color.luminance(rows)
+
+    results = []
+    for n, (name, (scheme, colors)) in enumerate(zip(names, palettes)):
+        base = n * color.SLOTS
+        palette = list(zip(rows[base:base + 16], luminance[base:base + 16]))
+        for style_name in _style_names(scheme):
+            try:
+                style = _resolve_style(scheme, colors, style_name)
+            except (ValueError, KeyError):  # style refers to a missing color
+                continue
+            if 'foreground' not in style or 'background' not in style:
+                continue  # no contrast to speak of
+            background = color.parse_rgb(style['background'])
+            fg, bg = color.luminance([color.parse_rgb(style['foreground']),
+                                      background])
+            # The background's own slot trivially has no contrast.
+            others = [l for rgb, l in palette if rgb != background]
+            results.append({
+                'name': name,
+                'style': style_name,
+                'contrast': color.contrast_ratio(fg, bg),
+                'min_palette_contrast': min(color.contrast_ratio(l, bg)
+                                            for l in others or [bg]),
+            })
+    if not distances:
+        return names, results, None
+    points = color.SPACES[space](rows)
+    per_scheme = [points[i * color.SLOTS:i * color.SLOTS + 16]
+                  for i in range(len(names))]
+    return names, results, color.nearest_delta_e(per_scheme)
+
+@click.command()
+@click.option('--space', type=click.Choice(sorted(color.SPACES)),
+              default='lab', help="color space for distances")
+@click.option('--similar', is_flag=True,
+              help="also show each scheme's nearest neighbour")
+@click.option('-q', 'machine', is_flag=True,
+              help="machine-readable output (JSON Lines)")
+@click.argument('directories', nargs=-1,
+                type=click.Path(exists=True, file_okay=False))
+@click.pass_obj
+def analyze(user, space, similar, machine, directories):
+    """Rank schemes by contrast and similarity."""
+    directories = directories or [user.data_dir, PKG_SCHEMES_DIR]
+    schemes = []
+    for name, path in _iter_scheme_files(directories):
+        with open(path, 'rt', encoding='utf-8') as f:
+            try:
+                scheme = extend(user.data_dir, json.loads(f.read()))
+                _resolve_colors(scheme)
+            except (ValueError, KeyError) as err:
+                click.echo('Skipping {}: {}'.format(path, err), err=True)
+                continue
+        schemes.append((name, scheme))
+    if not schemes:
+        return
+
+    names, results, neighbours = analyze_schemes(schemes, space, similar)
+    results.sort(key=lambda r: r['contrast'], reverse=True)
+    nearest = {}
+    for name, neighbour in zip(names, neighbours or ()):
+        if neighbour is not None:
+            j, distance = neighbour
+            nearest[name] = (names[j], distance)
+
+    for r in results:
+        if r['name'] in nearest:
+            r['nearest'], r['delta_e'] = nearest[r['name']]
+        if machine:
+            click.echo(json.dumps(r))
+            continue
+        line = '{name:<30} {style:<12} {contrast:6.2f}:1  min {min_palette_contrast:5.2f}:1'
+        if 'nearest' in r:
+            line += '  ~ {nearest} ({delta_e:.1f})'
+        click.echo(line.format(**r))
@@ -46,7 +46,7 @@ def _read_string_as_colors(s):
 
 def _read_colors(colorfile):
     with open(colorfile, 'r') as f:
-        colors = _read_string_as_colors(s)
+        colors = _read_string_as_colors(f.read())
     return colors
 
 def _write_colors(colors, outfile=None):
@@ -133,12 +133,24 @@ def _get_user_data():
             return json.loads(f.read())
 
 def _save_user_pref(name, value):
-    user = _get_user_data()
-    if not user:
-        user = {}
-    user[name] = value
-    with open(USER_FILE, 'w') as f:
-        f.write(json.dumps(user))
+    import fcntl
+    # Serialize writers; readers only ever see a complete, renamed file.
+    lock = os.open(USER_FILE + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            user = _get_user_data()
+        except ValueError:
+            user = None
+        if not user:
+            user = {}
+        user[name] = value
+        tmp = '{}.{}.tmp'.format(USER_FILE, os.getpid())
+        with open(tmp, 'w') as f:
+            f.write(json.dumps(user))
+        os.replace(tmp, USER_FILE)
+    finally:
+        os.close(lock)
 
 def _get_user_pref(name):
     user = _get_user_data()
@@ -176,6 +188,25 @@ def _system_palette_template():
     else:
         return '\033]4;{};rgb:{}\033\\'
 
+# brightness -> default fg/bg/cs palette indices
+_TARGET_DEFAULTS = {
+    -1: {
+        'fg': 8,
+        'bg': 0,
+        'cs': 18
+        },
+    0: {
+        'fg': 7,
+        'bg': 0,
+        'cs': 18
+        },
+    1: {
+        'fg': 19,
+        'bg': 15,
+        'cs': 19
+        }
+}
+
 def set_theme(theme, brightness):
     if not theme:
         theme = _get_user_pref('theme')
@@ -191,33 +222,14 @@ def set_theme(theme, brightness):
     # Set the color palette.
     colors = _name_to_colors(theme)
     tmp = _system_palette_template()
-    for i, c in enumerate(colors):
-        # Emits the proper ANSI code
-        print(tmp.format(i, c), end='')
+    # Emits the proper ANSI codes in one go
+    print(''.join([tmp.format(i, c) for i, c in enumerate(colors)]), end='')
 
     # Update the user theme
     _save_user_pref('theme', theme)
 
-    defaults = {
-        -1: {
-            'fg': 8,
-            'bg': 0,
-            'cs': 18
-            },
-        0: {
-            'fg': 7,
-            'bg': 0,
-            'cs': 18
-            },
-        1: {
-            'fg': 19,
-            'bg': 15,
-            'cs': 19
-            }
-    }
-
     if brightness is None:
-        default = defaults[0]
+        default = _TARGET_DEFAULTS[0]
         fg = _get_user_pref('fg')
         fg = fg if fg is not None else default['fg']
         bg = _get_user_pref('bg')
@@ -225,7 +237,7 @@ def set_theme(theme, brightness):
         cs = _get_user_pref('cs')
         cs = cs if cs is not None else default['cs']
     else:
-        default = defaults[brightness]
+        default = _TARGET_DEFAULTS[brightness]
         fg = default['fg']
         bg = default['bg']
 
@@ -260,7 +272,30 @@ def _set_target(target, value):
     _save_user_pref(target, value)
 
 def print_vimfile():
-    raise NotImplementedError
+    """Prints the current theme as a vim colorscheme.
+
+    Uses the template of `ansi-scheme render vim`; its cterm colors are
+    palette indices, so they follow whichever theme is set later."""
+    from .render import _template, variables
+    from .scheme import default
+    theme = _get_user_pref('theme')
+    if not theme:
+        raise ValueError('First specify a colorscheme.')
+    theme_colors = _name_to_colors(theme)
+    # Slots a theme leaves out come from the defaults, as in render.
+    colors = default().colors()
+    colors.update((str(i), c) for i, c in enumerate(theme_colors))
+    scale = lambda v: 8 if len(theme_colors) < 22 and v > 15 else v
+    style = {}
+    for target, key in (('fg', 'foreground'), ('bg', 'background'),
+                        ('cs', 'cursor')):
+        value = _get_user_pref(target)
+        value = str(value if value is not None else
+                    _TARGET_DEFAULTS[0][target])
+        style[key] = (colors[str(scale(int(value)))] if len(value) < 6 else
+                      _cleanup(value))
+    print(_template('vim').substitute(variables(theme, 'ansi-theme',
+                                                colors, style)), end='')
 
 def print_colors(theme):
     if not theme:
@@ -0,0 +1,167 @@
+"""Compiled scheme cache.
+
+A compiled entry holds the escape output for one (scheme, style, template)
+combination along with the resolved palette and style it was built from.
+Entries live under `<data_dir>/cache` and are keyed on the scheme source's
+mtime and size, and on those of the other files it was resolved from
+(parents, overlays; see `inherit`), falling back to a content hash when any
+of them change, so a warm `load` is a single read of the entry followed by
+a single write.
+
+Entry layout:
+    <version> <mtime_ns> <size> <sha256> <output length> <sources length>\\n
+    <"<mtime_ns> <size> <path>\\n" per other source, "0 0" if absent>
+    <escape output>
+    <json of {"colors": ..., "style": ...}>
+"""
+import os
+import zlib
+
+CACHE_DIR = 'cache'
+VERSION = '3'
+
+
+def _entry_path(data_dir, scheme_name, style_name, template):
+    # The names are only there to be readable: '.' may appear in them, so
+    # "a.b"/"c" and "a"/"b.c" look alike. The crc32 tells them apart (NUL
+    # can't be in a file name) along with the template.
+    crc = zlib.crc32('\0'.join([VERSION, scheme_name, style_name,
+                                template]).encode('utf-8'))
+    name = '{}.{}.{:08x}'.format(scheme_name, style_name, crc)
+    return os.path.join(data_dir, CACHE_DIR, name)
+
+
+def _signature(path):
+    """Returns (mtime_ns, size) of the scheme source, or zeros if it has none."""
+    if path is None:  # built-in scheme, only invalidated by VERSION
+        return 0, 0
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size
+
+
+def _stat(path):
+    """Returns (mtime_ns, size) of `path`, or (0, 0) if it doesn't exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0, 0
+    return st.st_mtime_ns, st.st_size
+
+
+def _digest(path, sources=()):
+    """Returns the sha256 of the scheme source and the other sources."""
+    import hashlib
+    digest = hashlib.sha256()
+    for source in [path] + list(sources):
+        try:
+            with open(source, 'rb') as f:
+                data = f.read()
+        except (IOError, OSError, TypeError):  # absent, or built in (None)
+            digest.update(b'-')
+            continue
+        digest.update(str(len(data)).encode('ascii') + b':' + data)
+    return digest.hexdigest()
+
+
+def _sources_block(sources):
+    return ''.join('{} {} {}\n'.format(*(_stat(p) + (p,)))
+                   for p in sources).encode('utf-8')
+
+
+def _read(entry_path):
+    """Returns (header fields, body) or None if the entry is missing/corrupt."""
+    try:
+        with open(entry_path, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return None
+    header, sep, body = data.partition(b'\n')
+    fields = header.decode('ascii', 'replace').split(' ')
+    if not sep or len(fields) != 6 or fields[0] != VERSION:
+        return None
+    return fields, body
+
+
+def _write(entry_path, data):
+    """Writes `data` to `entry_path` via a temporary file and a rename."""
+    directory = os.path.dirname(entry_path)
+    os.makedirs(directory, exist_ok=True)
+    tmp = '{}.{}.tmp'.format(entry_path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, entry_path)
+
+
+def _lookup(data_dir, scheme_name, style_name, template, path):
+    """Returns (escape output, resolved JSON) of a current entry, or None."""
+    entry_path = _entry_path(data_dir, scheme_name, style_name, template)
+    entry = _read(entry_path)
+    if entry is None:
+        return None
+    fields, body = entry
+    try:
+        signature = _signature(path)
+        length, sources_length = int(fields[4]), int(fields[5])
+        recorded = [line.split(' ', 2) for line in
+                    body[:sources_length].decode('utf-8').splitlines()]
+        sources = [source for _, _, source in recorded]
+        stale = (signature != (int(fields[1]), int(fields[2])) or
+                 any(_stat(source) != (int(mtime), int(size))
+                     for mtime, size, source in recorded))
+    except (OSError, ValueError):
+        return None
+    body = body[sources_length:]
+    if stale:
+        # Touched but possibly unchanged; compare contents before giving up.
+        if _digest(path, sources) != fields[3]:
+            return None
+        fields[1], fields[2] = str(signature[0]), str(signature[1])
+        block = _sources_block(sources)
+        fields[5] = str(len(block))
+        _write(entry_path, ' '.join(fields).encode('ascii') + b'\n' + block +
+               body)
+    return body[:length], body[length:]
+
+
+def lookup(data_dir, scheme_name, style_name, template, path):
+    """Returns the cached escape output as bytes, or None on a miss.
+
+    `path` is the scheme's source file (None for built-in schemes)."""
+    found = _lookup(data_dir, scheme_name, style_name, template, path)
+    return None if found is None else found[0]
+
+
+def lookup_resolved(data_dir, scheme_name, style_name, template,
+                    path):
+    """Returns the cached (output, colors, style), or None on a miss.
+
+    Like `lookup`, but also returns the resolved palette from the same
+    read of the entry."""
+    import json
+    found = _lookup(data_dir, scheme_name, style_name, template, path)
+    if found is None:
+        return None
+    output, resolved = found
+    try:
+        resolved = json.loads(resolved.decode('utf-8'))
+        return output, resolved['colors'], resolved['style']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def store(data_dir, scheme_name, style_name, template, path,
+          colors, style, output, sources=()):
+    """Caches the escape `output` (bytes) and the resolved colors/style.
+
+    `sources` are the other files the scheme was resolved from; the entry
+    is stale once any of them changes."""
+    import json
+    mtime, size = _signature(path)
+    block = _sources_block(sources)
+    header = ' '.join([VERSION, str(mtime), str(size),
+                       _digest(path, sources), str(len(output)),
+                       str(len(block))])
+    resolved = json.dumps({'colors': colors, 'style': style})
+    _write(_entry_path(data_dir, scheme_name, style_name, template),
+           header.encode('ascii') + b'\n' + block + output +
+           resolved.encode('utf-8'))
@@ -1,13 +1,90 @@
-from .user import User
-from .ls import ls
-from .load import load
+from importlib import import_module
+
+from . import timings
 
 import click
 
-@click.group()
+from .user import User
+
+class _LazyGroup(click.Group):
+    """A click group that only imports a subcommand's module when it runs."""
+
+    def __init__(self, *args, **kwargs):
+        self.lazy_commands = kwargs.pop('lazy_commands', {})
+        super(_LazyGroup, self).__init__(*args, **kwargs)
+
+    def list_commands(self, ctx):
+        commands = super(_LazyGroup, self).list_commands(ctx)
+        return sorted(set(commands) | set(self.lazy_commands))
+
+    def get_command(self, ctx, name):
+        if name in self.lazy_commands:
+            module_name, attr = self.lazy_commands[name].rsplit('.', 1)
+            return getattr(import_module(module_name, __package__), attr)
+        return super(_LazyGroup, self).get_command(ctx, name)
+
+def _timings_target(value):
+    """Returns where --timings-log sends timings: None for off, '-' for
+    stderr, or a file path.
+
+    Raises click.BadParameter for a bare word that isn't a switch, so a
+    stray ANSI_SCHEME_PROFILE=yes doesn't create a file named "yes"."""
+    import os
+    word = (value or '').strip().lower()
+    if word in ('', '0', 'false', 'no', 'off'):
+        return None
+    if word in ('1', 'true', 'yes', 'on', '-', 'stderr'):
+        return '-'
+    if value.startswith('file:') and len(value) > 5:
+        return value[5:]
+    if os.sep in value or (os.altsep and os.altsep in value):
+        return value
+    raise click.BadParameter(
+            '{!r} is neither a switch nor a path; use file:{} for a file '
+            'in the current directory.'.format(value, value),
+            param_hint="'--timings-log' / ANSI_SCHEME_PROFILE")
+
+@click.group(cls=_LazyGroup, lazy_commands={
+    'ls': '.ls.ls',
+    'load': '.load.load',
+    'daemon': '.daemon.daemon',
+    'register': '.daemon.register',
+    'analyze': '.analyze.analyze',
+    'import': '.importer.import_',
+    'sync': '.sync.sync',
+    'pack': '.pack.pack',
+    'unpack': '.pack.unpack',
+    'preview': '.preview.preview',
+    'compile': '.compile.compile_',
+    'render': '.render.render_',
+    'snapshot': '.snapshot.snapshot',
+    'restore': '.snapshot.restore',
+    'tmux': '.tmux.tmux',
+    'generate': '.generate.generate_',
+})
+@click.option('--timings', 'timings_', is_flag=True,
+              help="report per-stage timings on stderr")
+@click.option('--timings-log', metavar='TARGET', envvar='ANSI_SCHEME_PROFILE',
+              help="append per-stage timings as JSON to file:PATH or a path "
+                   "with a directory (1, - or stderr for stderr; 0, false, "
+                   "no or empty for off)")
+@click.option('--profile-stats', metavar='FILE',
+              envvar='ANSI_SCHEME_PROFILE_STATS',
+              help="dump cProfile stats of the command to FILE")
 @click.pass_context
-def cli(ctx):
-    ctx.obj = User()
+def cli(ctx, timings_, timings_log, profile_stats):
+    target = '-' if timings_ else _timings_target(timings_log)
+    if target:
+        timings.enable()
+        ctx.call_on_close(lambda: timings.report(target))
+    if profile_stats:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
 
-cli.add_command(ls)
-cli.add_command(load)
+        def dump():
+            profiler.disable()
+            profiler.dump_stats(profile_stats)
+        ctx.call_on_close(dump)
+    with timings.stage('user_init'):
+        ctx.obj = User()
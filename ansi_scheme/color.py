@@ -0,0 +1,254 @@
+"""Color-space conversions and metrics over resolved palettes.
+
+Colors come out of `_resolve_colors` as "ab/cd/ef" strings; this module
+turns whole palettes into rows of (r, g, b) bytes and converts them in bulk.
+The sRGB transfer curve is applied through a 256-entry lookup table, so a
+batch conversion is table lookups and a few multiplies per color.
+
+When NumPy is installed (it comes with the `image` extra), big batches are
+converted as arrays instead. Small ones stay in pure Python unless NumPy is
+already loaded, as importing it takes far longer than they do.
+"""
+import sys
+import math
+
+SLOTS = 22
+NUMPY_MIN = 4096  # values in a batch worth importing NumPy for
+NUMPY_BLOCK = 1 << 20  # floats of differences worked on at once
+
+_numpy_module = []
+
+def _numpy(size):
+    """Returns NumPy for a batch of `size` values, or None if it's missing
+    or not worth importing."""
+    if size < NUMPY_MIN and 'numpy' not in sys.modules:
+        return None
+    if not _numpy_module:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy_module.append(numpy)
+    return _numpy_module[0]
+
+def _tuples(array):
+    return [tuple(row) for row in array.tolist()]
+
+def _linearize(c):
+    c = c / 255.0
+    return c / 12.92 if c <= 0.04045 else ((c + 0.055) / 1.055) ** 2.4
+
+# sRGB byte -> linear light
+LINEAR = [_linearize(c) for c in range(256)]
+
+# Linear sRGB -> XYZ (D65)
+_XYZ = ((0.4124564, 0.3575761, 0.1804375),
+        (0.2126729, 0.7151522, 0.0721750),
+        (0.0193339, 0.1191920, 0.9503041))
+_WHITE = (0.95047, 1.0, 1.08883)
+
+def parse_rgb(value):
+    """Returns (r, g, b) bytes for an "ab/cd/ef" string."""
+    r, g, b = value.split('/')
+    return int(r, 16), int(g, 16), int(b, 16)
+
+def format_rgb(rgb):
+    """Returns the "ab/cd/ef" string for (r, g, b) bytes."""
+    return '{:02x}/{:02x}/{:02x}'.format(*rgb)
+
+def palette_rows(colors, fallback=None, slots=SLOTS):
+    """Returns `slots` (r, g, b) rows for a resolved colors dict.
+
+    Missing slots come from `fallback` (another resolved colors dict)."""
+    rows = []
+    for i in range(slots):
+        value = colors.get(str(i))
+        if value is None and fallback is not None:
+            value = fallback.get(str(i))
+        rows.append(parse_rgb(value) if value is not None else (0, 0, 0))
+    return rows
+
+def _linear_array(np, rows):
+    return np.asarray(LINEAR)[np.asarray(rows, dtype=np.intp).reshape(-1, 3)]
+
+def to_linear(rows):
+    lin = LINEAR
+    return [(lin[r], lin[g], lin[b]) for r, g, b in rows]
+
+def luminance(rows):
+    """Returns the WCAG relative luminance of each row."""
+    np = _numpy(len(rows))
+    if np is not None:
+        return (_linear_array(np, rows) @ [0.2126, 0.7152, 0.0722]).tolist()
+    lin = LINEAR
+    return [0.2126 * lin[r] + 0.7152 * lin[g] + 0.0722 * lin[b]
+            for r, g, b in rows]
+
+def contrast_ratio(l1, l2):
+    """Returns the WCAG contrast ratio between two luminances."""
+    hi, lo = (l1, l2) if l1 > l2 else (l2, l1)
+    return (hi + 0.05) / (lo + 0.05)
+
+def _lab_f(t):
+    return t ** (1.0 / 3) if t > 216.0 / 24389 else (24389.0 / 27 * t + 16) / 116
+
+def to_lab(rows):
+    """Converts (r, g, b) rows to CIE L*a*b* (D65)."""
+    np = _numpy(len(rows))
+    if np is not None:
+        t = _linear_array(np, rows) @ np.asarray(_XYZ).T / _WHITE
+        fx, fy, fz = np.where(t > 216.0 / 24389, np.cbrt(t),
+                              (24389.0 / 27 * t + 16) / 116).T
+        return _tuples(np.stack([116 * fy - 16, 500 * (fx - fy),
+                                 200 * (fy - fz)], 1))
+    (a0, a1, a2), (b0, b1, b2), (c0, c1, c2) = _XYZ
+    wx, wy, wz = _WHITE
+    f = _lab_f
+    out = []
+    for r, g, b in to_linear(rows):
+        fx = f((a0 * r + a1 * g + a2 * b) / wx)
+        fy = f((b0 * r + b1 * g + b2 * b) / wy)
+        fz = f((c0 * r + c1 * g + c2 * b) / wz)
+        out.append((116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)))
+    return out
+
+# Linear sRGB -> LMS, and cube-rooted LMS -> OKLab
+OKLAB_LMS = ((0.4122214708, 0.5363325363, 0.0514459929),
+             (0.2119034982, 0.6806995451, 0.1073969566),
+             (0.0883024619, 0.2817188376, 0.6299787005))
+OKLAB_LAB = ((0.2104542553, 0.7936177850, -0.0040720468),
+             (1.9779984951, -2.4285922050, 0.4505937099),
+             (0.0259040371, 0.7827717662, -0.8086757660))
+# ... and back: OKLab -> cube-rooted LMS, LMS -> linear sRGB
+OKLAB_LMS_INV = ((1.0, 0.3963377774, 0.2158037573),
+                 (1.0, -0.1055613458, -0.0638541728),
+                 (1.0, -0.0894841775, -1.2914855480))
+LMS_LINEAR = ((4.0767416621, -3.3077115913, 0.2309699292),
+              (-1.2684380046, 2.6097574011, -0.3413193965),
+              (-0.0041960863, -0.7034186147, 1.7076147010))
+
+def to_oklab(rows):
+    """Converts (r, g, b) rows to OKLab."""
+    np = _numpy(len(rows))
+    if np is not None:
+        lms = np.cbrt(_linear_array(np, rows) @ np.asarray(OKLAB_LMS).T)
+        return _tuples(lms @ np.asarray(OKLAB_LAB).T)
+    (a0, a1, a2), (b0, b1, b2), (c0, c1, c2) = OKLAB_LMS
+    (d0, d1, d2), (e0, e1, e2), (f0, f1, f2) = OKLAB_LAB
+    out = []
+    for r, g, b in to_linear(rows):
+        l = (a0 * r + a1 * g + a2 * b) ** (1.0 / 3)
+        m = (b0 * r + b1 * g + b2 * b) ** (1.0 / 3)
+        s = (c0 * r + c1 * g + c2 * b) ** (1.0 / 3)
+        out.append((d0 * l + d1 * m + d2 * s,
+                    e0 * l + e1 * m + e2 * s,
+                    f0 * l + f1 * m + f2 * s))
+    return out
+
+def from_oklab(points):
+    """Converts OKLab points back to clamped (r, g, b) rows."""
+    np = _numpy(len(points))
+    if np is not None:
+        lms = (np.asarray(points, dtype=float).reshape(-1, 3) @
+               np.asarray(OKLAB_LMS_INV).T) ** 3
+        c = np.clip(lms @ np.asarray(LMS_LINEAR).T, 0.0, 1.0)
+        c = np.where(c <= 0.0031308, c * 12.92,
+                     1.055 * c ** (1 / 2.4) - 0.055)
+        return _tuples(np.rint(c * 255).astype(int))
+
+    def encode(c):
+        c = min(max(c, 0.0), 1.0)
+        c = c * 12.92 if c <= 0.0031308 else 1.055 * c ** (1 / 2.4) - 0.055
+        return int(round(c * 255))
+    (_, i1, i2), (_, j1, j2), (_, k1, k2) = OKLAB_LMS_INV
+    (a0, a1, a2), (b0, b1, b2), (c0, c1, c2) = LMS_LINEAR
+    out = []
+    for L, a, b in points:
+        l = (L + i1 * a + i2 * b) ** 3
+        m = (L + j1 * a + j2 * b) ** 3
+        s = (L + k1 * a + k2 * b) ** 3
+        out.append((encode(a0 * l + a1 * m + a2 * s),
+                    encode(b0 * l + b1 * m + b2 * s),
+                    encode(c0 * l + c1 * m + c2 * s)))
+    return out
+
+SPACES = {
+    'lab': to_lab,
+    'oklab': to_oklab
+}
+
+def delta_e(p, q):
+    """Returns the mean Euclidean distance between two equal-length point
+    lists (CIE76 Delta E when the points are L*a*b*)."""
+    dist = math.dist
+    return sum(dist(a, b) for a, b in zip(p, q)) / len(p)
+
+def nearest_delta_e(palettes):
+    """Returns (index, `delta_e`) of each palette's nearest other palette,
+    the lowest index on ties; None for a lone palette.
+
+    Only one row of distances (a block of rows with NumPy) exists at a
+    time, never the whole n x n matrix."""
+    n = len(palettes)
+    if not n:
+        return []
+    np = _numpy(n * n * len(palettes[0]))
+    if np is not None:
+        points = np.asarray(palettes, dtype=float)
+        nearest = []
+        # Rows of a block times every palette's points: ~NUMPY_BLOCK floats.
+        block = max(1, NUMPY_BLOCK // max(1, n * points[0].size))
+        for start in range(0, n, block):
+            d = points[start:start + block, None] - points[None]
+            row = np.sqrt(np.einsum('ijkl,ijkl->ijk', d, d)).mean(2)
+            row[np.arange(len(row)), np.arange(start, start + len(row))] = \
+                np.inf
+            best = row.argmin(1)
+            nearest.extend((int(j), float(row[i, j])) if n > 1 else None
+                           for i, j in enumerate(best))
+        return nearest
+    nearest = [None] * n
+    for i in range(n):
+        for j in range(i + 1, n):
+            d = delta_e(palettes[i], palettes[j])
+            # Candidates reach each palette in index order.
+            if nearest[i] is None or d < nearest[i][1]:
+                nearest[i] = (j, d)
+            if nearest[j] is None or d < nearest[j][1]:
+                nearest[j] = (i, d)
+    return nearest
+
+# Cube corners (r, g, b axis bits) -> base palette slot.
+_CUBE_CORNERS = {
+    (0, 0, 0): '0', (1, 0, 0): '1', (0, 1, 0): '2', (1, 1, 0): '3',
+    (0, 0, 1): '4', (1, 0, 1): '5', (0, 1, 1): '6', (1, 1, 1): '15'
+}
+
+def extended_palette(colors):
+    """Returns slots 16-255 generated from a scheme's base colors.
+
+    The 6x6x6 cube is interpolated trilinearly in OKLab between Black, the
+    six normal accents and BrightWhite; the 24-step grayscale ramp runs
+    from Black to BrightWhite. Everything is converted in one batch."""
+    corners = dict(zip(_CUBE_CORNERS,
+                       to_oklab([parse_rgb(colors[s])
+                                 for s in _CUBE_CORNERS.values()])))
+
+    def lerp(p, q, t):
+        return tuple(a + (b - a) * t for a, b in zip(p, q))
+
+    points = []
+    for r in range(6):
+        for g in range(6):
+            # Interpolate along r and g first, then walk b.
+            edges = {}
+            for b in (0, 1):
+                lo = lerp(corners[(0, 0, b)], corners[(1, 0, b)], r / 5.0)
+                hi = lerp(corners[(0, 1, b)], corners[(1, 1, b)], r / 5.0)
+                edges[b] = lerp(lo, hi, g / 5.0)
+            points.extend(lerp(edges[0], edges[1], b / 5.0)
+                          for b in range(6))
+    black, white = corners[(0, 0, 0)], corners[(1, 1, 1)]
+    points.extend(lerp(black, white, (i + 1) / 25.0) for i in range(24))
+    return dict((str(16 + i), format_rgb(rgb))
+                for i, rgb in enumerate(from_oklab(points)))
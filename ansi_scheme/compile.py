@@ -0,0 +1,153 @@
+"""Precompiled shell snippets.
+
+`ansi-scheme compile` writes the escape output for every terminal template
+to `<data_dir>/compiled/current.<kind>.esc`, and a snippet per shell,
+`<data_dir>/compiled/apply.<shell>`, that picks the right one the way
+`detect_kind` does and prints it with the shell's printf builtin. Sourcing
+the snippet from an rc file applies the scheme without starting Python.
+
+`compiled/source.json` records what was compiled; once it exists, `load`
+recompiles whenever the loaded scheme or style changes.
+"""
+import os
+import json
+
+import click
+
+from .constants import *
+from . import cache, inherit
+from .terminal import BACKENDS
+
+SHELLS = ['sh', 'bash', 'zsh', 'fish']
+SOURCE = 'source.json'
+
+def _compiled_dir(data_dir):
+    return os.path.join(data_dir, COMPILED_DIR)
+
+def _write(path, data):
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+def _output(data_dir, scheme_name, style_name, kind):
+    """Returns the full escape output for `kind`, via the compiled cache.
+
+    Raises ValueError if the scheme or style is unavailable."""
+    from .load import _scheme_path, _resolve_scheme
+    backend = BACKENDS[kind]()
+    path = _scheme_path(data_dir, scheme_name)
+    output = cache.lookup(data_dir, scheme_name, style_name,
+                          backend.template, path)
+    if output is None:
+        scheme = _resolve_scheme(data_dir, scheme_name)
+        colors = scheme.colors()
+        style = scheme.style(style_name).as_dict()
+        output = backend.payload(colors, style)
+        cache.store(data_dir, scheme_name, style_name, backend.template,
+                    path, colors, style, output,
+                    inherit.sources(data_dir, scheme_name))
+    return output
+
+def _printf(output, shell):
+    """Returns a printf command line that writes `output`."""
+    text = output.decode('utf-8').replace('\\', '\\\\').replace('%', '%%')
+    # POSIX printf only knows octal escapes; fish prefers \x.
+    text = text.replace('\033', '\\x1b' if shell == 'fish' else '\\033')
+    if shell == 'fish':  # backslashes are special in fish's single quotes
+        text = text.replace('\\', '\\\\').replace("'", "\\'")
+    else:
+        text = text.replace("'", "'\\''")
+    return "printf '{}'".format(text)
+
+def _snippet(outputs, shell, scheme_name, style_name):
+    header = '# Generated by `ansi-scheme compile`: {} ({}).\n'.format(
+            scheme_name, style_name)
+    if shell == 'fish':
+        return header + (
+            'if isatty stdout\n'
+            '    if test -n "$TMUX"\n'
+            '        {tmux}\n'
+            '    else if string match -q "screen*" -- "$TERM$TERMINAL"\n'
+            '        {screen}\n'
+            '    else\n'
+            '        {plain}\n'
+            '    end\n'
+            'end\n').format(**dict((kind, _printf(output, shell))
+                                  for kind, output in outputs.items()))
+    return header + (
+        'if [ -t 1 ]; then\n'
+        '  if [ -n "$TMUX" ]; then\n'
+        '    {tmux}\n'
+        '  else\n'
+        '    case "${{TERM:-$TERMINAL}}" in\n'
+        '      screen*) {screen} ;;\n'
+        '      *) {plain} ;;\n'
+        '    esac\n'
+        '  fi\n'
+        'fi\n').format(**dict((kind, _printf(output, shell))
+                              for kind, output in outputs.items()))
+
+def compile_scheme(data_dir, scheme_name, style_name, shells):
+    """Writes the escape files and snippets; returns the snippet paths.
+
+    Raises ValueError if the scheme or style is unavailable."""
+    outputs = dict((kind, _output(data_dir, scheme_name, style_name, kind))
+                   for kind in BACKENDS)
+    directory = _compiled_dir(data_dir)
+    os.makedirs(directory, exist_ok=True)
+    for kind, output in outputs.items():
+        _write(os.path.join(directory, 'current.{}.esc'.format(kind)), output)
+    paths = []
+    for shell in shells:
+        path = os.path.join(directory, 'apply.' + shell)
+        _write(path, _snippet(outputs, shell, scheme_name,
+                              style_name).encode('utf-8'))
+        paths.append(path)
+    _write(os.path.join(directory, SOURCE), json.dumps(
+            {'scheme': scheme_name, 'style': style_name,
+             'shells': shells}).encode('utf-8'))
+    return paths
+
+def refresh(data_dir, scheme_name, style_name, changed=False):
+    """Recompiles for `load` if compiled snippets are in use and the scheme,
+    its source (`changed`) or the style differs from what they apply."""
+    try:
+        with open(os.path.join(_compiled_dir(data_dir), SOURCE)) as f:
+            source = json.load(f)
+    except (IOError, OSError, ValueError):
+        return
+    if (not changed and source.get('scheme') == scheme_name and
+            source.get('style') == style_name):
+        return
+    try:
+        compile_scheme(data_dir, scheme_name, style_name,
+                       source.get('shells', SHELLS))
+    except (ValueError, IOError, OSError) as err:
+        click.echo('Cannot recompile shell snippets: {}'.format(err),
+                   err=True)
+
+def _default_shell():
+    shell = os.path.basename(os.environ.get('SHELL', ''))
+    return shell if shell in SHELLS else 'sh'
+
+@click.command('compile')
+@click.option('--shell', 'shells', type=click.Choice(SHELLS), multiple=True,
+              help="shells to write snippets for (default: $SHELL)")
+@click.argument('scheme', required=False)
+@click.argument('style', required=False)
+@click.pass_obj
+def compile_(user, shells, scheme, style):
+    """Write shell snippets that apply a scheme without Python.
+
+    Source the printed file from your shell's rc file; `load` keeps it up
+    to date afterwards."""
+    scheme_name = scheme or user.settings['scheme_name']
+    style_name = style or user.settings['style_name'] or DEFAULT_STYLE
+    try:
+        paths = compile_scheme(user.data_dir, scheme_name, style_name,
+                               list(shells) or [_default_shell()])
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    for path in paths:
+        click.echo(path)
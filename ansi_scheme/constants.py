@@ -1,5 +1,12 @@
+import os
+
 EXT = '.ansischeme'
 PKG_SCHEMES = 'default-schemes'
+PKG_SCHEMES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               PKG_SCHEMES)
+DAEMON_SOCKET = 'daemon.sock'
+COMPILED_DIR = 'compiled'
+OVERLAY_DIR = 'overlays'
 
 DEFAULT_STYLES = {
         "dark": {
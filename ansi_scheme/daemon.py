@@ -0,0 +1,230 @@
+"""Long-running daemon that pushes palettes to every registered terminal.
+
+Terminals register their tty (and which escape templates they need) over a
+Unix socket in the data directory. `load` forwards the scheme to the daemon,
+which keeps resolved schemes in memory and writes the escape output to all
+registered ttys concurrently.
+
+The protocol is one JSON object per line in each direction:
+    {"op": "register", "tty": "/dev/pts/3", "kind": "tmux"}
+    {"op": "unregister", "tty": "/dev/pts/3"}
+    {"op": "load", "scheme": "atelier-heath", "style": "dark",
+     "exclude": ["/dev/pts/3"]}
+    {"op": "status"}
+"""
+import os
+import json
+import errno
+import signal
+import socket
+
+import click
+
+from . import inherit, state
+from .constants import DAEMON_SOCKET
+from .load import _resolve_scheme
+from .state import controlling_tty
+from .terminal import BACKENDS, detect_kind
+
+def _socket_path(data_dir):
+    return os.path.join(data_dir, DAEMON_SOCKET)
+
+def request(data_dir, message, timeout=2.0):
+    """Sends `message` to the daemon and returns its reply.
+
+    Returns None if no daemon is listening."""
+    path = _socket_path(data_dir)
+    if not os.path.exists(path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(timeout)
+    try:
+        client.connect(path)
+        client.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        reply = client.makefile('rb').readline()
+    except (OSError, socket.timeout):
+        return None
+    finally:
+        client.close()
+    return json.loads(reply.decode('utf-8')) if reply else None
+
+def _write_tty(tty, payload):
+    """Writes `payload` to `tty`; returns False if the tty has gone away."""
+    try:
+        fd = os.open(tty, os.O_WRONLY | os.O_NOCTTY)
+    except OSError:
+        return False
+    try:
+        while payload:
+            payload = payload[os.write(fd, payload):]
+    except OSError as exc:
+        if exc.errno in (errno.EIO, errno.ENXIO, errno.EBADF):
+            return False
+        raise
+    finally:
+        os.close(fd)
+    return True
+
+def _report_failure(task):
+    """Reports the exception that stopped the scheduler, if any."""
+    if task.cancelled() or task.exception() is None:
+        return
+    import traceback
+    error = task.exception()
+    click.echo('Schedule stopped:\n' + ''.join(traceback.format_exception(
+            type(error), error, error.__traceback__)).rstrip(), err=True)
+
+class Daemon(object):
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.scheduler = None
+        # tty path -> template kind
+        self.terminals = {}
+        # (scheme, style) -> (source signature, colors, style)
+        self.resolved = {}
+        # (scheme, style, kind) -> payload bytes
+        self.payloads = {}
+
+    def _resolve(self, scheme_name, style_name):
+        """Raises ValueError if the scheme or style is unavailable."""
+        signature = inherit.signature(self.data_dir, scheme_name)
+        key = (scheme_name, style_name)
+        cached = self.resolved.get(key)
+        if cached is None or cached[0] != signature:
+            scheme = _resolve_scheme(self.data_dir, scheme_name)
+            colors = scheme.colors()
+            style = scheme.style(style_name).as_dict()
+            cached = self.resolved[key] = (signature, colors, style)
+            for kind in BACKENDS:
+                self.payloads.pop(key + (kind,), None)
+        return cached[1], cached[2]
+
+    def _payload(self, scheme_name, style_name, kind):
+        key = (scheme_name, style_name, kind)
+        colors, style = self._resolve(scheme_name, style_name)
+        if key not in self.payloads:
+            self.payloads[key] = BACKENDS[kind]().payload(colors, style)
+        return self.payloads[key]
+
+    async def broadcast(self, scheme_name, style_name, exclude=(), only=None):
+        """Writes the scheme to every registered terminal (or those in
+        `only`) at once."""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        targets = [(tty, kind) for tty, kind in self.terminals.items()
+                   if tty not in exclude and (only is None or tty in only)]
+        writes = [loop.run_in_executor(
+                      None, _write_tty, tty,
+                      self._payload(scheme_name, style_name, kind))
+                  for tty, kind in targets]
+        results = await asyncio.gather(*writes)
+        colors, style = self._resolve(scheme_name, style_name)
+        for (tty, kind), ok in zip(targets, results):
+            if not ok:  # closed terminal
+                self.terminals.pop(tty, None)
+            elif not BACKENDS[kind].passthrough:
+                state.write(self.data_dir, tty, colors, style)
+        return sum(results)
+
+    async def handle(self, message):
+        op = message.get('op')
+        if op == 'register':
+            self.terminals[message['tty']] = message.get('kind', 'plain')
+            if self.scheduler is not None:
+                self.scheduler.wake.set()
+            return {'ok': True}
+        elif op == 'unregister':
+            self.terminals.pop(message['tty'], None)
+            return {'ok': True}
+        elif op == 'load':
+            try:
+                count = await self.broadcast(message['scheme'],
+                                             message['style'],
+                                             message.get('exclude', ()))
+            except ValueError as err:
+                return {'ok': False, 'error': str(err)}
+            return {'ok': True, 'terminals': count}
+        elif op == 'status':
+            return {'ok': True, 'terminals': self.terminals}
+        return {'ok': False, 'error': 'Unknown op {!r}.'.format(op)}
+
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = await self.handle(json.loads(line.decode('utf-8')))
+                except (ValueError, KeyError) as err:
+                    reply = {'ok': False, 'error': str(err)}
+                writer.write(json.dumps(reply).encode('utf-8') + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def serve(self):
+        import asyncio
+        path = _socket_path(self.data_dir)
+        if os.path.exists(path):
+            if request(self.data_dir, {'op': 'status'}) is not None:
+                raise click.ClickException(
+                        'A daemon is already listening on {}'.format(path))
+            os.remove(path)  # stale socket
+        server = await asyncio.start_unix_server(self._client, path=path)
+        loop = asyncio.get_running_loop()
+        tasks = []
+        if self.scheduler is not None:
+            task = loop.create_task(self.scheduler.run())
+            task.add_done_callback(_report_failure)
+            tasks.append(task)
+        stop = loop.create_future()
+        loop.add_signal_handler(signal.SIGTERM, stop.set_result, None)
+        try:
+            async with server:
+                await stop
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            if os.path.exists(path):
+                os.remove(path)
+
+@click.command()
+@click.option('--schedule', is_flag=True,
+              help="switch schemes by the rules in schedule.json")
+@click.pass_obj
+def daemon(user, schedule):
+    """Run the palette daemon in the foreground."""
+    import asyncio
+
+    async def run():
+        server = Daemon(user.data_dir)
+        if schedule:
+            from .schedule import Scheduler, schedule_path
+            try:
+                server.scheduler = Scheduler(server)
+            except (IOError, OSError, ValueError) as err:
+                raise click.ClickException('Cannot read {}: {}'.format(
+                        schedule_path(user.data_dir), err))
+        await server.serve()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+@click.command()
+@click.option('--tty', help="tty to register (defaults to the current one)")
+@click.option('--kind', type=click.Choice(sorted(BACKENDS)),
+              help="escape templates the tty needs")
+@click.option('--remove', is_flag=True, help="unregister instead")
+@click.pass_obj
+def register(user, tty, kind, remove):
+    """Register a terminal with the daemon."""
+    tty = tty or controlling_tty()
+    if tty is None:
+        raise click.ClickException('Not attached to a tty; pass --tty.')
+    message = {'op': 'unregister' if remove else 'register', 'tty': tty,
+               'kind': kind or detect_kind()}
+    if request(user.data_dir, message) is None:
+        raise click.ClickException('The daemon is not running.')
@@ -0,0 +1,220 @@
+"""Parsers for colorscheme formats found in the wild.
+
+Each parser takes the text (or bytes) of a scheme file and returns a scheme
+dict in `.ansischeme` form. Raises ValueError if the input isn't usable.
+"""
+import re
+
+from .constants import *
+from .load import _parse_rgb_hex
+
+# base16 slot for each ANSI index, following base16-shell.
+BASE16_SLOTS = ['00', '08', '0B', '0A', '0D', '0E', '0C', '05',
+                '03', '08', '0B', '0A', '0D', '0E', '0C', '07',
+                '09', '0F', '01', '02', '04', '06']
+
+# Color names used by alacritty for indices 0-7.
+ALACRITTY_NAMES = ['black', 'red', 'green', 'yellow',
+                   'blue', 'magenta', 'cyan', 'white']
+
+def _text(data):
+    return data.decode('utf-8', 'replace') if isinstance(data, bytes) else data
+
+def _luminance(value):
+    r, g, b = [int(c, 16) for c in value.split('/')]
+    return 0.2126 * r + 0.7152 * g + 0.0722 * b
+
+def _scheme(indexed, foreground=None, background=None, cursor=None):
+    """Builds a scheme dict from {index: "ab/cd/ef"} and optional style
+    colors."""
+    if not all(i in indexed for i in range(16)):
+        raise ValueError('Colors 0-15 are not all defined.')
+    colors = {}
+    for i, value in sorted(indexed.items()):
+        colors[COLORS[i] if i < len(COLORS) else str(i)] = value
+    scheme = {'colors': colors}
+    if background and foreground:
+        style = {'foreground': foreground, 'background': background}
+        if cursor:
+            style['cursor'] = cursor
+        style_name = 'dark' if _luminance(background) < 128 else 'light'
+        scheme['styles'] = {style_name: style}
+        scheme['default_style'] = style_name
+    return scheme
+
+def _simple_yaml(text):
+    """Flattens the nested `key: scalar` mappings of a YAML document into
+    {"a.b.c": "value"}. Lists, anchors and multi-line scalars are ignored."""
+    values = {}
+    stack = []  # (indent, key)
+    for line in text.splitlines():
+        stripped = line.split(' #')[0].rstrip()
+        if not stripped.strip() or stripped.lstrip().startswith(('#', '-')):
+            continue
+        indent = len(stripped) - len(stripped.lstrip())
+        key, sep, value = stripped.strip().partition(':')
+        if not sep:
+            continue
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+        path = '.'.join([k for _, k in stack] + [key.strip().strip('\'"')])
+        value = value.strip().strip('\'"')
+        if value:
+            values[path] = value
+        else:
+            stack.append((indent, key.strip().strip('\'"')))
+    return values
+
+def _flatten(mapping, prefix=''):
+    values = {}
+    for k, v in mapping.items():
+        if isinstance(v, dict):
+            values.update(_flatten(v, prefix + k + '.'))
+        else:
+            values[prefix + k] = str(v)
+    return values
+
+def parse_base16(data):
+    """Parses a base16 (or base24) YAML scheme."""
+    values = _simple_yaml(_text(data))
+    slots = {}
+    for path, value in values.items():
+        m = re.match(r'(?:palette\.)?base([0-9a-fA-F]{2})$', path)
+        if m:
+            slots[m.group(1).upper()] = _parse_rgb_hex(value)
+    if not all(s in slots for s in BASE16_SLOTS):
+        raise ValueError('Not a complete base16 scheme.')
+    indexed = dict((i, slots[s]) for i, s in enumerate(BASE16_SLOTS))
+    scheme = _scheme(indexed)
+    scheme['styles'] = {
+        'dark': {'foreground': 'White', 'background': 'Black',
+                 'cursor': '20'},
+        'light': {'foreground': 'BrightBlack', 'background': 'BrightWhite',
+                  'cursor': '19'}
+    }
+    return scheme
+
+def parse_iterm(data):
+    """Parses an iTerm2 `.itermcolors` property list."""
+    import plistlib
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    try:
+        plist = plistlib.loads(data)
+    except Exception as err:  # plistlib raises a variety of parse errors
+        raise ValueError('Invalid property list: {}'.format(err))
+
+    def rgb(key):
+        entry = plist.get(key)
+        if not entry:
+            return None
+        return '/'.join('{:02x}'.format(
+            int(round(float(entry.get(c + ' Component', 0)) * 255)))
+            for c in ('Red', 'Green', 'Blue'))
+
+    indexed = dict((i, rgb('Ansi {} Color'.format(i))) for i in range(16))
+    indexed = dict((i, v) for i, v in indexed.items() if v)
+    return _scheme(indexed, rgb('Foreground Color'),
+                   rgb('Background Color'), rgb('Cursor Color'))
+
+def parse_xresources(data):
+    """Parses X resources (`*.color0: #rrggbb`, `#define` macros allowed)."""
+    defines = {}
+    indexed, style = {}, {}
+    for line in _text(data).splitlines():
+        line = line.strip()
+        m = re.match(r'#define\s+(\S+)\s+(\S+)', line)
+        if m:
+            defines[m.group(1)] = m.group(2)
+            continue
+        if line.startswith('!') or ':' not in line:
+            continue
+        key, value = [s.strip() for s in line.split(':', 1)]
+        value = defines.get(value, value)
+        key = re.split(r'[.*]', key)[-1]
+        try:
+            if re.match(r'color\d+$', key):
+                indexed[int(key[5:])] = _parse_rgb_hex(value)
+            elif key in ('foreground', 'background', 'cursorColor'):
+                style[key] = _parse_rgb_hex(value)
+        except ValueError:  # not a color value
+            continue
+    return _scheme(indexed, style.get('foreground'), style.get('background'),
+                   style.get('cursorColor'))
+
+def parse_kitty(data):
+    """Parses a kitty theme/config (`color0 #rrggbb`)."""
+    indexed, style = {}, {}
+    for line in _text(data).splitlines():
+        parts = line.split()
+        if len(parts) < 2 or parts[0].startswith('#'):
+            continue
+        key, value = parts[0], parts[1]
+        try:
+            if re.match(r'color\d+$', key):
+                indexed[int(key[5:])] = _parse_rgb_hex(value)
+            elif key in ('foreground', 'background', 'cursor'):
+                style[key] = _parse_rgb_hex(value)
+        except ValueError:  # e.g. "cursor none"
+            continue
+    return _scheme(indexed, style.get('foreground'), style.get('background'),
+                   style.get('cursor'))
+
+def parse_alacritty(data):
+    """Parses the colors of an alacritty config (YAML or TOML)."""
+    text = _text(data)
+    values = None
+    if '[colors' in text:
+        try:
+            import tomllib
+            values = _flatten(tomllib.loads(text))
+        except ImportError:
+            raise ValueError('TOML configs need Python 3.11 or newer.')
+        except ValueError as err:  # tomllib.TOMLDecodeError
+            raise ValueError('Invalid TOML: {}'.format(err))
+    else:
+        values = _simple_yaml(text)
+
+    def get(path):
+        value = values.get('colors.' + path)
+        if value and value[:2].lower() == '0x':  # YAML configs use 0xrrggbb
+            value = value[2:]
+        return _parse_rgb_hex(value) if value else None
+
+    indexed = {}
+    for i, name in enumerate(ALACRITTY_NAMES):
+        for offset, group in ((0, 'normal'), (8, 'bright')):
+            value = get('{}.{}'.format(group, name))
+            if value:
+                indexed[i + offset] = value
+    return _scheme(indexed, get('primary.foreground'),
+                   get('primary.background'), get('cursor.cursor'))
+
+PARSERS = {
+    'base16': parse_base16,
+    'iterm': parse_iterm,
+    'xresources': parse_xresources,
+    'kitty': parse_kitty,
+    'alacritty': parse_alacritty,
+}
+
+def detect(filename, data):
+    """Guesses the format of a scheme file; returns None if unknown."""
+    name = filename.lower()
+    head = _text(data[:4096])
+    if name.endswith('.itermcolors') or '<plist' in head:
+        return 'iterm'
+    if name.endswith(('.yaml', '.yml')):
+        return 'base16' if re.search(r'base0[0-9A-Fa-f]\s*:', head) \
+            else 'alacritty'
+    if name.endswith('.toml'):
+        return 'alacritty'
+    if 'xresources' in name or name.endswith(('.xdefaults', '.ad')):
+        return 'xresources'
+    if name.endswith('.conf'):
+        return 'kitty'
+    if re.search(r'^\s*\S*color0\s*:', head, re.M):
+        return 'xresources'
+    if re.search(r'^\s*color0\s+\S', head, re.M):
+        return 'kitty'
+    return None
@@ -0,0 +1,273 @@
+"""Schemes generated from images.
+
+`ansi-scheme generate --from-image wallpaper.png` shrinks the image to a
+few tens of thousands of pixels while decoding it, converts them to OKLab
+in one NumPy pass and clusters them with mini-batch k-means. The clusters
+then steer a base16-style layout:
+
+    0 18 19 8 20 7 21 15   a lightness ramp from the darkest to the
+                           lightest cluster, tinted by their hue
+    1-6, 9-14              accents at fixed hues (red ... magenta), each
+                           pulled towards the nearest colorful cluster
+    16, 17                 orange and brown, likewise
+
+so that both DEFAULT_STYLES (White on Black, BrightBlack on BrightWhite)
+stay legible whatever the image. Needs Pillow and NumPy
+(`pip install ansi-scheme[image]`).
+"""
+import os
+import sys
+import json
+import math
+
+import click
+
+from .constants import *
+from . import color
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+IMAGE_EXTS = ('.png', '.jpg', '.jpeg', '.webp', '.bmp', '.gif', '.tif',
+              '.tiff')
+SAMPLE = 256  # longest side after downsampling
+CLUSTERS = 16
+BATCH = 2048
+STEPS = 60
+
+# Ramp slot -> position between the darkest (0) and lightest (1) color.
+RAMP = (('0', 0.0), ('18', 0.08), ('19', 0.17), ('8', 0.4), ('20', 0.58),
+        ('7', 0.75), ('21', 0.88), ('15', 1.0))
+# Accent slots -> OKLab hue in degrees, lightness, chroma scale.
+ACCENTS = (('1', 29, 0.6, 1.0), ('2', 142, 0.6, 1.0), ('3', 100, 0.68, 1.0),
+           ('4', 264, 0.6, 1.0), ('5', 328, 0.6, 1.0), ('6', 195, 0.62, 1.0),
+           ('16', 55, 0.64, 1.0), ('17', 40, 0.48, 0.7))
+BRIGHTER = 0.08  # lightness added for the bright accents (slots 9-14)
+MAX_SHIFT = 25.0  # degrees an accent may drift towards the image
+CHROMA = 0.1, 0.2  # accent chroma bounds
+MIN_CHROMA = 0.03  # clusters grayer than this don't steer accents
+RAMP_CHROMA = 0.03
+
+def _missing():
+    """Returns the missing optional packages, as pip names."""
+    missing = [] if np is not None else ['numpy']
+    try:
+        import PIL
+    except ImportError:
+        missing.insert(0, 'Pillow')
+    return missing
+
+def pixels(path, sample=SAMPLE):
+    """Returns an (n, 3) uint8 array of the image shrunk to `sample` pixels
+    on its longest side.
+
+    JPEGs are decoded at reduced scale; other formats are box-filtered."""
+    from PIL import Image
+    with Image.open(path) as img:
+        img.draft('RGB', (sample, sample))
+        img = img.convert('RGB')
+    factor = -(-max(img.size) // sample)
+    if factor > 1:
+        img = img.reduce(factor)
+    return np.asarray(img, dtype=np.uint8).reshape(-1, 3)
+
+def to_oklab(rgb):
+    """Converts an (n, 3) uint8 array to OKLab."""
+    linear = np.asarray(color.LINEAR)[rgb]
+    return np.cbrt(linear @ np.asarray(color.OKLAB_LMS).T) @ \
+        np.asarray(color.OKLAB_LAB).T
+
+def _nearest(points, centers):
+    """Returns the index of each point's nearest center.
+
+    |p - c|^2 = |p|^2 - 2 p.c + |c|^2, and |p|^2 doesn't change the
+    argmin, so one matrix product does it."""
+    return ((centers ** 2).sum(1) - 2.0 * points @ centers.T).argmin(1)
+
+def _init(points, k, rng):
+    """k-means++ seeding."""
+    centers = [points[rng.integers(len(points))]]
+    dist = ((points - centers[0]) ** 2).sum(1)
+    for _ in range(1, k):
+        total = dist.sum()
+        i = rng.choice(len(points), p=dist / total) if total > 0 else \
+            rng.integers(len(points))
+        centers.append(points[i])
+        dist = np.minimum(dist, ((points - points[i]) ** 2).sum(1))
+    return np.array(centers)
+
+def kmeans(points, k=CLUSTERS, seed=0, batch=BATCH, steps=STEPS):
+    """Mini-batch k-means; returns (centers, cluster sizes).
+
+    Each step moves a center towards the mean of its share of a random
+    batch, at a rate of 1/(points it has seen so far)."""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(points))
+    centers = _init(points[rng.integers(len(points), size=batch)], k, rng)
+    seen = np.zeros(k)
+    for _ in range(steps):
+        sample = points[rng.integers(len(points), size=batch)]
+        nearest = _nearest(sample, centers)
+        counts = np.bincount(nearest, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, nearest, sample)
+        seen += counts
+        hit = counts > 0
+        centers[hit] += (counts[hit] / seen[hit])[:, None] * \
+            (sums[hit] / counts[hit][:, None] - centers[hit])
+    sizes = np.bincount(_nearest(points, centers), minlength=k)
+    return centers, sizes
+
+def _polar(L, chroma, hue):
+    h = math.radians(hue)
+    return L, chroma * math.cos(h), chroma * math.sin(h)
+
+def _hue_distance(a, b):
+    return (a - b + 180.0) % 360.0 - 180.0
+
+def palette(centers, sizes):
+    """Returns {slot: "ab/cd/ef"} for clusters given as OKLab centers and
+    sizes, plus the default style the image suggests."""
+    clusters = [(float(L), float(a), float(b), int(n))
+                for (L, a, b), n in zip(centers, sizes) if n]
+    total = float(sum(n for _, _, _, n in clusters))
+    by_lightness = sorted(clusters)
+    dark, light = by_lightness[0], by_lightness[-1]
+
+    def tint(cluster, L):
+        _, a, b, _ = cluster
+        chroma = math.hypot(a, b)
+        scale = min(1.0, RAMP_CHROMA / chroma) if chroma else 0.0
+        return L, a * scale, b * scale
+
+    ends = (tint(dark, min(max(dark[0], 0.12), 0.3)),
+            tint(light, min(max(light[0], 0.92), 0.98)))
+    points = dict((slot, tuple(p + (q - p) * t for p, q in zip(*ends)))
+                  for slot, t in RAMP)
+
+    colorful = [(math.degrees(math.atan2(b, a)), math.hypot(a, b), n)
+                for _, a, b, n in clusters if math.hypot(a, b) >= MIN_CHROMA]
+    mean_chroma = (sum(c * n for _, c, n in colorful) /
+                   sum(n for _, _, n in colorful)) if colorful else CHROMA[0]
+    for slot, hue, L, scale in ACCENTS:
+        chroma = mean_chroma
+        if colorful:
+            # The closest hue wins; larger clusters may be a little farther.
+            shift, chroma, _ = min(
+                    ((_hue_distance(h, hue), c, n) for h, c, n in colorful),
+                    key=lambda x: abs(x[0]) - 10.0 * x[2] / total)
+            hue += max(-MAX_SHIFT, min(MAX_SHIFT, shift))
+        chroma = min(max(chroma, CHROMA[0]), CHROMA[1]) * scale
+        points[slot] = _polar(L, chroma, hue)
+        if int(slot) < 8:
+            points[str(int(slot) + 8)] = _polar(L + BRIGHTER, chroma, hue)
+
+    slots = sorted(points, key=int)
+    rows = color.from_oklab([points[s] for s in slots])
+    colors = dict((s, color.format_rgb(rgb)) for s, rgb in zip(slots, rows))
+    mean_lightness = sum(L * n for L, _, _, n in clusters) / total
+    return colors, 'light' if mean_lightness > 0.6 else 'dark'
+
+def generate(path, seed=0):
+    """Returns a scheme dict generated from the image at `path`.
+
+    Raises OSError if the image can't be read."""
+    centers, sizes = kmeans(to_oklab(pixels(path)), seed=seed)
+    colors, style = palette(centers, sizes)
+    named = dict((COLORS[int(k)] if int(k) < len(COLORS) else k, v)
+                 for k, v in colors.items())
+    return {'colors': named, 'default_style': style}
+
+def _generate(job):
+    """Generates one scheme; runs in a worker process.
+
+    `job` is (name, path, seed). Returns (name, scheme dict or None, error
+    message or None)."""
+    name, path, seed = job
+    try:
+        return name, generate(path, seed), None
+    except (ValueError, IOError, OSError) as err:
+        return name, None, str(err) or err.__class__.__name__
+
+def _iter_jobs(sources, name, seed, output, force=False, report=None):
+    """Yields a (name, path, seed) job per image.
+
+    Unless `force`, images whose scheme already exists in `output`, or is
+    made from an earlier image, are left out and passed to `report`
+    instead."""
+    def jobs():
+        for source in sources:
+            if os.path.isdir(source):
+                for entry in sorted(os.listdir(source)):
+                    if os.path.splitext(entry)[1].lower() in IMAGE_EXTS:
+                        yield (os.path.splitext(entry)[0],
+                               os.path.join(source, entry), seed)
+            else:
+                stem = os.path.splitext(os.path.basename(source))[0]
+                yield name or stem, source, seed
+    seen = set()
+    for job in jobs():
+        if not force and (job[0] in seen or
+                          os.path.exists(os.path.join(output, job[0] + EXT))):
+            if report is not None:
+                report(job[0])
+            continue
+        seen.add(job[0])
+        yield job
+
+@click.command('generate')
+@click.option('--from-image', 'sources', multiple=True, required=True,
+              type=click.Path(exists=True),
+              help="image, or directory of images, to take colors from")
+@click.option('--name', help="scheme name (defaults to the image's name)")
+@click.option('-j', '--jobs', type=int, default=None,
+              help="worker processes (defaults to the number of cores)")
+@click.option('--seed', type=int, default=0, show_default=True,
+              help="k-means seed")
+@click.option('--force', is_flag=True, help="overwrite existing schemes")
+@click.option('-o', '--output', type=click.Path(file_okay=False),
+              help="directory to write to (defaults to the user schemes)")
+@click.pass_obj
+def generate_(user, sources, name, jobs, seed, force, output):
+    """Generate schemes from the colors of images."""
+    missing = _missing()
+    if missing:
+        raise click.ClickException(
+                'generate needs {}: pip install ansi-scheme[image]'
+                .format(' and '.join(missing)))
+    if name and (len(sources) > 1 or os.path.isdir(sources[0])):
+        raise click.UsageError('--name takes a single image.')
+    output = output or user.data_dir
+    os.makedirs(output, exist_ok=True)
+
+    from concurrent.futures import ProcessPoolExecutor
+    existing = []
+
+    def report(scheme_name):
+        click.echo('{}: exists (use --force)'.format(scheme_name), err=True)
+        existing.append(scheme_name)
+    # Images whose scheme exists aren't decoded at all.
+    jobs_ = list(_iter_jobs(sources, name, seed, output, force, report))
+    generated, failed = 0, len(existing)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        # A single image isn't worth starting a worker for.
+        results = (pool.map(_generate, jobs_) if len(jobs_) > 1 else
+                   map(_generate, jobs_))
+        for scheme_name, scheme, error in results:
+            if scheme is None:
+                click.echo('{}: {}'.format(scheme_name, error), err=True)
+                failed += 1
+                continue
+            path = os.path.join(output, scheme_name + EXT)
+            tmp = '{}.{}.tmp'.format(path, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(scheme, f, indent=2, sort_keys=True)
+            os.replace(tmp, path)
+            click.echo(scheme_name)
+            generated += 1
+    click.echo('Generated {}, skipped {}.'.format(generated, failed),
+               err=True)
+    if failed and not generated:
+        sys.exit(1)
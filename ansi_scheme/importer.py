@@ -0,0 +1,125 @@
+import os
+import sys
+import json
+
+import click
+
+from .constants import *
+from .formats import PARSERS
+
+def _convert(job):
+    """Converts one scheme file; runs in a worker process.
+
+    `job` is (name, format or None, path or None, data or None). Returns
+    (name, scheme dict or None, error message or None)."""
+    from . import formats
+    name, fmt, path, data = job
+    try:
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        fmt = fmt or formats.detect(path or name, data)
+        if fmt is None:
+            return name, None, 'unrecognized format'
+        return name, formats.PARSERS[fmt](data), None
+    except (ValueError, KeyError, IOError, OSError) as err:
+        return name, None, str(err) or err.__class__.__name__
+
+def _convert_chunk(jobs):
+    """Converts a list of jobs in one worker call; see `_convert`."""
+    return [_convert(job) for job in jobs]
+
+def _results(pool, jobs, workers, chunksize=16):
+    """Yields `_convert` results in order, keeping at most 2 * `workers`
+    chunks in flight, so archives are read only as fast as they convert."""
+    from collections import deque
+    from itertools import islice
+    jobs = iter(jobs)
+    pending = deque()
+    while True:
+        while len(pending) < 2 * workers:
+            chunk = list(islice(jobs, chunksize))
+            if not chunk:
+                break
+            pending.append(pool.submit(_convert_chunk, chunk))
+        if not pending:
+            return
+        for result in pending.popleft().result():
+            yield result
+
+def _stem(path):
+    name = os.path.basename(path)
+    for suffix in ('.Xresources', '.xresources'):
+        if name.endswith(suffix) and name != suffix:
+            return name[:-len(suffix)]
+    stem = os.path.splitext(name)[0]
+    return stem[len('base16-'):] if stem.startswith('base16-') else stem
+
+def _iter_jobs(sources, fmt):
+    """Yields conversion jobs for files, directories and archives.
+
+    Archive members are read here so workers only see bytes."""
+    import tarfile
+    import zipfile
+    for source in sources:
+        if os.path.isdir(source):
+            for root, dirs, files in os.walk(source):
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
+                for f in sorted(files):
+                    if not f.startswith('.'):
+                        path = os.path.join(root, f)
+                        yield _stem(path), fmt, path, None
+        elif zipfile.is_zipfile(source):
+            with zipfile.ZipFile(source) as archive:
+                for info in archive.infolist():
+                    if not info.is_dir():
+                        yield (_stem(info.filename), fmt, info.filename,
+                               archive.read(info))
+        elif tarfile.is_tarfile(source):
+            with tarfile.open(source) as archive:
+                for member in archive:
+                    if member.isfile():
+                        yield (_stem(member.name), fmt, member.name,
+                               archive.extractfile(member).read())
+        else:
+            yield _stem(source), fmt, source, None
+
+@click.command('import')
+@click.option('--format', 'fmt', type=click.Choice(sorted(PARSERS)),
+              help="skip format detection")
+@click.option('-j', '--jobs', type=int, default=None,
+              help="worker processes (defaults to the number of cores)")
+@click.option('--force', is_flag=True, help="overwrite existing schemes")
+@click.option('-o', '--output', type=click.Path(file_okay=False),
+              help="directory to write to (defaults to the user schemes)")
+@click.argument('sources', nargs=-1, required=True,
+                type=click.Path(exists=True))
+@click.pass_obj
+def import_(user, fmt, jobs, force, output, sources):
+    """Convert scheme files, directories or archives to .ansischeme."""
+    from concurrent.futures import ProcessPoolExecutor
+    output = output or user.data_dir
+    os.makedirs(output, exist_ok=True)
+
+    imported = failed = 0
+    workers = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        # Results stream back in order as workers finish each chunk.
+        for name, scheme, error in _results(pool, _iter_jobs(sources, fmt),
+                                            workers):
+            if scheme is None:
+                click.echo('{}: {}'.format(name, error), err=True)
+                failed += 1
+                continue
+            path = os.path.join(output, name + EXT)
+            if os.path.exists(path) and not force:
+                click.echo('{}: exists (use --force)'.format(name), err=True)
+                failed += 1
+                continue
+            with open(path, 'w') as f:
+                json.dump(scheme, f, indent=2, sort_keys=True)
+            click.echo(name)
+            imported += 1
+    click.echo('Imported {}, skipped {}.'.format(imported, failed), err=True)
+    if failed and not imported:
+        sys.exit(1)
@@ -0,0 +1,314 @@
+"""On-disk nearest-scheme index.
+
+Each scheme is reduced to a feature vector in L*a*b*: the background and
+foreground of its default style plus the mean of its normal and bright
+accent colors (1-6 and 9-14). Vectors live in one file,
+`<data_dir>/index/schemes.index`, replaced as a whole on every save:
+
+    "<version> <tree_size> <rows> <names length> <deps length>
+     <mtime_ns size of each watched path>\n"
+    names     one "name\n" line per row ("" for a dropped row)
+    offsets   uint64 start of each row's deps, plus the end of the last
+    deps      "mtime_ns size path<TAB>..." per row: every file the scheme
+              was resolved from (its source, parents, overlays; see
+              `inherit.sources`)
+    features  float64 rows, the first `tree_size` in implicit k-d tree
+              order, the rest an unsorted tail of recent additions
+
+Queries stay cheap however many schemes there are. The scheme directories,
+the overlays and the pack are only listed again when one of their own
+mtimes or sizes changes, which adding or removing a scheme does; new
+schemes are then appended to the tail and removed ones dropped. Editing a
+scheme in place doesn't touch its directory, so the rows a query returns
+are checked against their files, like compiled-cache entries are, and
+re-read if they changed. Dropped rows stay in place, skipped, until the
+tree is rebuilt once they and the tail outgrow a fraction of it.
+"""
+import os
+import math
+import heapq
+from array import array
+
+from .constants import *
+
+INDEX_DIR = 'index'
+INDEX_FILE = 'schemes.index'
+VERSION = '4'
+DIM = 12
+
+def features(scheme):
+    """Returns the feature vector of a scheme dict.
+
+    Raises ValueError if the scheme can't be resolved."""
+    from .analyze import _resolve_palette
+    from .load import _resolve_style
+    from . import color
+    colors = _resolve_palette(scheme)
+    style_name = scheme.get('default_style', DEFAULT_STYLE)
+    try:
+        style = _resolve_style(scheme, colors, style_name)
+    except (ValueError, KeyError):
+        style = _resolve_style(scheme, colors, DEFAULT_STYLE)
+    rows = color.palette_rows(colors, slots=16)
+    lab = color.to_lab([color.parse_rgb(style['background']),
+                        color.parse_rgb(style['foreground'])] + rows)
+    vector = list(lab[0]) + list(lab[1])
+    for accents in (lab[3:9], lab[11:17]):
+        vector.extend(sum(p[d] for p in accents) / len(accents)
+                      for d in range(3))
+    return vector
+
+def _kd_order(points, indices, depth=0):
+    """Returns `indices` arranged as an implicit k-d tree.
+
+    The root of a range is its middle element; the left half holds the
+    points below it on axis `depth % DIM`."""
+    if len(indices) <= 1:
+        return list(indices)
+    axis = depth % DIM
+    indices = sorted(indices, key=lambda i: points[i * DIM + axis])
+    mid = len(indices) // 2
+    return (_kd_order(points, indices[:mid], depth + 1) + [indices[mid]] +
+            _kd_order(points, indices[mid + 1:], depth + 1))
+
+def _format_deps(deps):
+    return '\t'.join('{} {} {}'.format(mtime, size, path)
+                     for path, (mtime, size) in deps).encode('utf-8')
+
+def _parse_deps(line):
+    """Returns [(path, (mtime_ns, size))] for a deps line; raises
+    ValueError."""
+    deps = []
+    for field in line.decode('utf-8').split('\t') if line else ():
+        mtime, size, path = field.split(' ', 2)
+        deps.append((path, (int(mtime), int(size))))
+    return deps
+
+class SchemeIndex(object):
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.path = os.path.join(data_dir, INDEX_DIR)
+        self.points = array('d')
+        self.names = []  # per row; '' once dropped
+        self.offsets = array('Q', [0])
+        self.deps = b''
+        self.tree_size = 0
+        self.signature = None
+
+    def _dirs(self):
+        return [self.data_dir, PKG_SCHEMES_DIR]
+
+    def _signature(self):
+        """Returns the (mtime_ns, size) of every path whose change means
+        schemes may have come or gone."""
+        from . import cache
+        from .inherit import OVERLAY_DIR
+        from .pack import pack_path
+        watched = self._dirs() + [os.path.join(self.data_dir, OVERLAY_DIR),
+                                  pack_path(self.data_dir)]
+        return tuple(n for path in watched for n in cache._stat(path))
+
+    def load(self):
+        """Reads the index from disk; returns False, leaving the index
+        empty, if there is none or it can't be used."""
+        try:
+            with open(os.path.join(self.path, INDEX_FILE), 'rb') as f:
+                data = f.read()
+            newline = data.index(b'\n')
+            fields = [int(n) for n in data[:newline].decode('ascii').split()]
+            if len(fields) < 5 or fields[0] != int(VERSION):
+                return False
+            tree_size, rows, names_len, deps_len = fields[1:5]
+            # Slice the large blocks without copying them.
+            body = memoryview(data)[newline + 1:]
+            names = str(body[:names_len], 'utf-8').split('\n')[:-1]
+            end = names_len + (rows + 1) * 8
+            offsets = array('Q')
+            offsets.frombytes(body[names_len:end])
+            deps = body[end:end + deps_len]
+            points = array('d')
+            points.frombytes(body[end + deps_len:])
+        except (IOError, OSError, ValueError):
+            return False
+        if not (len(names) == rows and len(points) == rows * DIM and
+                0 <= tree_size <= rows and offsets[-1] == deps_len):
+            return False
+        self.points, self.names, self.tree_size = points, names, tree_size
+        self.offsets, self.deps = offsets, deps
+        self.signature = tuple(fields[5:])
+        return True
+
+    def save(self):
+        """Writes the index to a temporary file and renames it into place,
+        so readers see either the old index or the new one."""
+        os.makedirs(self.path, exist_ok=True)
+        names = ''.join(name + '\n' for name in self.names).encode('utf-8')
+        header = ' '.join(str(n) for n in
+                          (VERSION, self.tree_size, len(self.names),
+                           len(names), len(self.deps)) +
+                          (self.signature or ())) + '\n'
+        path = os.path.join(self.path, INDEX_FILE)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(header.encode('ascii') + names +
+                    self.offsets.tobytes())
+            f.write(self.deps)
+            f.write(self.points.tobytes())
+        os.replace(tmp, path)
+
+    def _names(self):
+        """Returns the names of every user, packed and package scheme."""
+        from .pack import open_pack
+        packed = open_pack(self.data_dir)
+        names = set(name for name, _ in packed.names('user')) if packed \
+            else set()
+        for directory in self._dirs():
+            names.update(entry.name[:-len(EXT)]
+                         for entry in os.scandir(directory)
+                         if entry.name.endswith(EXT))
+        names.discard('')
+        return names
+
+    def _current(self, row, stats):
+        """Whether none of the files `row` was built from changed."""
+        from . import cache
+        try:
+            deps = _parse_deps(bytes(
+                    self.deps[self.offsets[row]:self.offsets[row + 1]]))
+        except ValueError:
+            return False
+        for path, signature in deps:
+            if path not in stats:
+                stats[path] = cache._stat(path)
+            if stats[path] != signature:
+                return False
+        return True
+
+    def _drop(self, rows):
+        for row in rows:
+            self.names[row] = ''
+
+    def _add(self, names):
+        """Reads and appends schemes; unusable ones are left out."""
+        from . import inherit
+        if not isinstance(self.deps, bytearray):
+            self.deps = bytearray(self.deps)
+        for name in names:
+            try:
+                vector = features(inherit.resolve(self.data_dir, name))
+                deps = inherit.signature(self.data_dir, name)
+            except (ValueError, KeyError, IOError, OSError):  # unparseable
+                continue
+            self.points.extend(vector)
+            self.names.append(name)
+            self.deps += _format_deps(deps)
+            self.offsets.append(len(self.deps))
+
+    def _settle(self):
+        """Rebuilds the tree once dropped rows and the tail outgrow it."""
+        loose = (len(self.names) - self.tree_size +
+                 sum(1 for name in self.names[:self.tree_size]
+                     if not name))
+        if loose > max(256, self.tree_size // 8):
+            self.rebuild()
+
+    def update(self, force=False):
+        """Brings the index up to date with the schemes that exist.
+
+        Does nothing while the scheme directories, overlays and pack are
+        unchanged, unless `force`; otherwise adds new schemes and drops
+        removed ones, and after overlay or pack changes (or if `force`)
+        also re-reads every scheme whose files changed. Returns whether
+        anything changed."""
+        signature = self._signature()
+        if not force and signature == self.signature:
+            return False
+        names = self._names()
+        # Overlays and the pack can change any scheme without renaming.
+        everything = (force or self.signature is None or
+                      signature[4:] != self.signature[4:])
+        stats = {}
+        stale = [row for row, name in enumerate(self.names) if name and
+                 (name not in names or
+                  everything and not self._current(row, stats))]
+        self._drop(stale)  # and read again below, if they still exist
+        self._add(sorted(names - set(self.names)))
+        self.signature = signature
+        self._settle()
+        self.save()
+        return True
+
+    def rebuild(self):
+        """Sorts every remaining row into implicit k-d tree order."""
+        rows = [row for row, name in enumerate(self.names) if name]
+        order = _kd_order(self.points, rows)
+        points, deps, offsets = array('d'), bytearray(), array('Q', [0])
+        for row in order:
+            points.extend(self.points[row * DIM:(row + 1) * DIM])
+            deps += self.deps[self.offsets[row]:self.offsets[row + 1]]
+            offsets.append(len(deps))
+        self.names = [self.names[row] for row in order]
+        self.points, self.deps, self.offsets = points, deps, offsets
+        self.tree_size = len(order)
+
+    def _nearest(self, vector, k, exclude):
+        """Returns up to k (squared distance, row) pairs, nearest first.
+
+        Subtrees are pruned on the squared distance from `vector` to their
+        cell, kept up to date one axis at a time (Arya and Mount)."""
+        points, names = self.points, self.names
+        dist = math.dist
+        heap = []  # max-heap of (-squared distance, row)
+
+        def consider(row):
+            if not names[row] or names[row] in exclude:
+                return
+            d = dist(points[row * DIM:(row + 1) * DIM], vector) ** 2
+            if len(heap) < k:
+                heapq.heappush(heap, (-d, row))
+            elif d < -heap[0][0]:
+                heapq.heapreplace(heap, (-d, row))
+
+        # (lo, hi, depth, squared distance to the cell, per-axis offsets)
+        stack = [(0, self.tree_size, 0, 0.0, (0.0,) * DIM)]
+        while stack:
+            lo, hi, depth, bound, offsets = stack.pop()
+            # Skip subtrees that can't beat the current k-th best.
+            if lo >= hi or (len(heap) == k and bound >= -heap[0][0]):
+                continue
+            mid = (lo + hi) // 2
+            consider(mid)
+            axis = depth % DIM
+            diff = vector[axis] - points[mid * DIM + axis]
+            near, far = (((lo, mid), (mid + 1, hi)) if diff < 0 else
+                         ((mid + 1, hi), (lo, mid)))
+            old = offsets[axis]
+            stack.append(far + (depth + 1, bound - old * old + diff * diff,
+                                offsets[:axis] + (diff,) +
+                                offsets[axis + 1:]))
+            stack.append(near + (depth + 1, bound, offsets))
+        for row in range(self.tree_size, len(names)):
+            consider(row)
+        return sorted((-d, row) for d, row in heap)
+
+    def nearest(self, vector, k=10, exclude=()):
+        """Returns up to k (distance, name) pairs closest to `vector`.
+
+        Schemes among them whose files changed since they were indexed
+        are read again first (and the index saved)."""
+        stats, changed = {}, False
+        while True:
+            found = self._nearest(vector, k, exclude)
+            stale = [row for _, row in found
+                     if not self._current(row, stats)]
+            if not stale:
+                break
+            names = [self.names[row] for row in stale]
+            self._drop(stale)
+            self._add(names)  # leaves out schemes that are gone
+            changed = True
+        if changed:
+            self._settle()
+            self.save()
+        return [(d ** 0.5 if d > 0 else 0.0, self.names[row])
+                for d, row in found]
@@ -0,0 +1,137 @@
+"""Scheme inheritance and per-user overlays.
+
+A scheme may name one or more parents to build on:
+
+    {"extends": "atelier-heath",
+     "colors": {"Blue": "5c/7c/fa"},
+     "styles": {"dark": {"cursor": "Red"}}}
+
+Parents are merged in order, later ones winning, and the scheme goes on
+top: colors slot by slot, styles key by key (a style the parents lack
+starts from DEFAULT_STYLES), and `default_style` or `palette` only if the
+scheme leaves them out. `<data_dir>/overlays/<name>.ansischeme` is laid
+over `<name>` the same way, wherever `<name>` comes from and wherever it is
+used as a parent; overlays can't extend anything themselves.
+
+Resolved schemes are memoized per process together with the files they
+were built from: their own and their ancestors' sources, the overlays, and
+the places a user scheme or pack could shadow any of them from. An entry
+is reused while none of those changed, so editing a parent only
+re-resolves its descendants, here and (through `sources`) in the
+compiled-output cache.
+"""
+import os
+import json
+from io import open
+
+from .constants import *
+from . import cache
+from .pack import pack_path
+from .scheme import INDEX
+
+# (data_dir, name) -> (resolved scheme dict, [(path, signature)])
+_memo = {}
+
+def overlay_path(data_dir, scheme_name):
+    return os.path.join(data_dir, OVERLAY_DIR, scheme_name + EXT)
+
+def _current(deps):
+    return all(cache._stat(path) == signature for path, signature in deps)
+
+def _parents(scheme):
+    parents = scheme.get('extends') or []
+    return [parents] if isinstance(parents, str) else list(parents)
+
+def _shadows(data_dir, scheme_name, path):
+    """Returns the paths that would take over `scheme_name` from `path` if
+    they appeared (a user scheme, then the pack)."""
+    ahead = []
+    for candidate in (os.path.join(data_dir, scheme_name + EXT),
+                      pack_path(data_dir)):
+        if candidate == path:
+            break
+        ahead.append(candidate)
+    return ahead
+
+def _by_slot(colors):
+    return ((str(INDEX.get(k.lower(), k)), v) for k, v in colors.items())
+
+def merge(base, scheme):
+    """Returns `scheme` laid over `base`; colors are keyed by slot."""
+    merged = dict(base)
+    merged.update((k, v) for k, v in scheme.items()
+                  if k not in ('colors', 'styles', 'extends'))
+    colors = dict(_by_slot(base.get('colors', {})))
+    colors.update(_by_slot(scheme.get('colors', {})))
+    styles = dict((k, dict(v)) for k, v in base.get('styles', {}).items())
+    for k, v in scheme.get('styles', {}).items():
+        styles.setdefault(k, dict(DEFAULT_STYLES.get(k, {}))).update(v)
+    merged['colors'] = colors
+    if styles:
+        merged['styles'] = styles
+    return merged
+
+def _extend(data_dir, scheme, chain, deps):
+    """Returns `scheme` merged over its parents, adding what they were
+    built from to `deps`."""
+    merged = {}
+    for parent in _parents(scheme):
+        resolved, parent_deps = _resolve(data_dir, parent, chain)
+        merged = merge(merged, resolved)
+        deps.extend(d for d in parent_deps if d not in deps)
+    return merge(merged, scheme)
+
+def _resolve(data_dir, scheme_name, chain=()):
+    """Returns (resolved scheme dict, dependencies).
+
+    Raises ValueError if a scheme is unavailable or inherits from itself."""
+    if scheme_name in chain:
+        raise ValueError('Schemes extend each other: {}.'.format(
+                ' -> '.join(chain + (scheme_name,))))
+    key = (data_dir, scheme_name)
+    cached = _memo.get(key)
+    if cached is not None and _current(cached[1]):
+        return cached
+    from .load import _read_colorscheme
+    scheme, path = _read_colorscheme(data_dir, scheme_name)
+    overlay = overlay_path(data_dir, scheme_name)
+    deps = [(p, cache._stat(p)) for p in
+            [overlay] + _shadows(data_dir, scheme_name, path) + [path] if p]
+    if _parents(scheme):
+        scheme = _extend(data_dir, scheme, chain + (scheme_name,), deps)
+    if deps[0][1] != (0, 0):
+        with open(overlay, 'rt', encoding='utf-8') as f:
+            layer = json.loads(f.read())
+        if not isinstance(layer, dict):
+            raise ValueError('{} is not a scheme.'.format(overlay))
+        layer.pop('extends', None)
+        scheme = merge(scheme, layer)
+    _memo[key] = scheme, deps
+    return _memo[key]
+
+def resolve(data_dir, scheme_name):
+    """Returns the scheme dict with its ancestors and overlay merged in.
+
+    Raises ValueError if a scheme is unavailable or inherits from itself."""
+    return _resolve(data_dir, scheme_name)[0]
+
+def sources(data_dir, scheme_name):
+    """Returns every file `scheme_name`'s resolution depends on, including
+    ones whose appearance would change it.
+
+    Raises ValueError like `resolve`."""
+    return [path for path, _ in _resolve(data_dir, scheme_name)[1]]
+
+def signature(data_dir, scheme_name):
+    """Returns a value that changes whenever `resolve` would.
+
+    Raises ValueError like `resolve`."""
+    return tuple(_resolve(data_dir, scheme_name)[1])
+
+def extend(data_dir, scheme):
+    """Returns a scheme dict read from anywhere merged over its parents.
+
+    Raises ValueError like `resolve`."""
+    if not _parents(scheme):
+        return scheme
+    return _extend(data_dir, scheme, (), [])
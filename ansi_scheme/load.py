@@ -1,158 +1,246 @@
 import os
-import re
 from io import open
-import pkg_resources
-import json
 
 import click
 
 from .constants import *
-
-def _add_from_github(scheme_name):
-    raise NotImplementedError()
+from . import cache, inherit, state, timings
+from .terminal import get_backend, diff
+from .pack import open_pack, pack_path
+from .transition import Duration
+from .scheme import INDEX, Scheme, parse_hex
+
+def _add_from_repository(user, scheme_name):
+    """Fetches the scheme from the configured repository if it changed."""
+    from .sync import Repository, _repository
+    repo = Repository(user.data_dir, _repository(user, None))
+    report = lambda message: click.echo(message, err=True)
+    try:
+        repo.sync(set([scheme_name]), report=report)
+    except (ValueError, OSError, KeyError) as err:
+        raise click.ClickException(str(err))
 
 def _parse_rgb_hex(string):
     """Resolves an ANSI hex value from the string."""
-    matches = re.findall('[0-9a-fA-F]', string)
-    if len(matches) < 6:
-        raise ValueError('Not enough hex values in "{}".'
-                .format(string))
-    r = ''.join(matches[:2])
-    g = ''.join(matches[2:4])
-    b = ''.join(matches[4:6])
-    return '/'.join([r, g, b])
+    return '{:02x}/{:02x}/{:02x}'.format(*parse_hex(string))
 
-def _resolve_colorscheme(data_dir, scheme_name, style_name):
-    """Raises ValueError if the scheme is unavailable."""
+def _scheme_path(data_dir, scheme_name):
+    """Returns the path of the scheme's source file (the pack file for
+    packed schemes), or None for 'default'.
+
+    Raises ValueError if the scheme is unavailable."""
     if scheme_name == 'default':
-        return DEFAULT_SCHEME
+        return None
     user_scheme_path = os.path.join(data_dir, scheme_name + EXT)
-    pkg_scheme_path = os.path.join(PKG_SCHEMES, scheme_name + EXT)
+    pkg_scheme_path = os.path.join(PKG_SCHEMES_DIR, scheme_name + EXT)
+    packed = open_pack(data_dir)
     if os.path.exists(user_scheme_path):
-        with open(user_scheme_path, 'rt') as f:
-            scheme = json.loads(f.read())
-    elif pkg_resources.resource_exists(__name__, pkg_scheme_path):
-        s = pkg_resources.resource_string(__name__,
-                            pkg_scheme_path).decode('utf-8')
-        scheme = json.loads(s)
+        return user_scheme_path
+    elif packed is not None and packed.origin(scheme_name) == 'user':
+        return pack_path(data_dir)
+    elif os.path.exists(pkg_scheme_path):
+        return pkg_scheme_path
     else:
         raise ValueError(
                 '{} is neither a user scheme nor a package scheme.'
                 .format(scheme_name))
-    return scheme
 
-def _resolve_colors(scheme):
-    """Returns a dict of color index i -> ab/cd/ef hex value.
+def _read_colorscheme(data_dir, scheme_name):
+    """Returns (the scheme's own dict, its source path or None).
+
+    Raises ValueError if the scheme is unavailable."""
+    import json
+    path = _scheme_path(data_dir, scheme_name)
+    if path is None:
+        return DEFAULT_SCHEME, None
+    if path == pack_path(data_dir):
+        return open_pack(data_dir).scheme(scheme_name), path
+    with open(path, 'rt', encoding='utf-8') as f:
+        scheme = json.loads(f.read())
+    if not isinstance(scheme, dict):
+        raise ValueError('{} is not a scheme.'.format(path))
+    return scheme, path
+
+def _resolve_colorscheme(data_dir, scheme_name, style_name):
+    """Returns the scheme dict with its parents and overlay merged in.
 
     Raises ValueError if the scheme is unavailable."""
-    colors = scheme['colors']
-    lowercase_colors = list(map(str.lower, COLORS))
-    return dict((str(lowercase_colors.index(k.lower()))
-                 if k.lower() in lowercase_colors else k,
-             _parse_rgb_hex(v))
-              for k, v in colors.items())
+    return inherit.resolve(data_dir, scheme_name)
+
+def _resolve_scheme(data_dir, scheme_name):
+    """Returns the resolved Scheme.
+
+    Raises ValueError if the scheme is unavailable."""
+    return Scheme.from_dict(inherit.resolve(data_dir, scheme_name),
+                            scheme_name)
+
+def _resolve_colors(scheme, extended=True):
+    """Returns a dict of color index i -> ab/cd/ef hex value.
+
+    Schemes with `"palette": 256` also get slots 16-255 generated from their
+    base colors, unless `extended` is False; slots the scheme defines win.
+
+    Raises ValueError if a color can't be parsed."""
+    if not isinstance(scheme, Scheme):
+        scheme = Scheme.from_dict(scheme)
+    return scheme.colors(extended)
 
 def _resolve_style_value(colors, v):
-    """"Raises IndexError"""
+    """Raises ValueError if `v` is neither hex nor a defined color."""
     try:
         return _parse_rgb_hex(v)
     except ValueError:  # Not a hex value.
         pass
-    if v.isdigit():  # it's a color index
-        try:
-            v = COLORS[int(v)] if int(v) <= len(COLORS) else v
-            return colors[v]
-        except KeyError:
-            raise ValueError('{} is not a defined color.'.format(v))
-    else:  # it's a color name
-        try:
-            index = [c.lower() for c in COLORS].index(v.lower())
-        except IndexError:
-            raise ValueError('{} is not a recognized color.'.format(v))
-        try:
-            return colors[str(index)]
-        except KeyError:
-            raise ValueError('{} is not a defined color.'.format(v))
+    try:
+        index = INDEX[v.lower()]
+    except KeyError:
+        raise ValueError('{} is not a recognized color.'.format(v))
+    try:
+        return colors[str(index)]
+    except KeyError:
+        raise ValueError('{} is not a defined color.'.format(v))
 
 def _resolve_style(scheme, colors, style_name):
     """Raises ValueError if the style is unavailable."""
-    try:
-        # Allow default overrides.
-        available_styles = DEFAULT_STYLES.copy()
-        available_styles.update(scheme.get('styles', {}))
-        style = available_styles[style_name]
-    except KeyError:
-        raise ValueError("Style '{}' is not defined for scheme '{}'"
-                .format(style_name, scheme_name))
+    styles = scheme.styles if isinstance(scheme, Scheme) else \
+        scheme.get('styles', {})
+    style = styles.get(style_name, DEFAULT_STYLES.get(style_name))
+    if style is None:
+        raise ValueError("Style '{}' is not defined for this scheme."
+                .format(style_name))
     return dict((k, _resolve_style_value(colors, v))
                 for k, v in style.items())
 
-def _palette_template():
-    """Returns a template for the terminal-color-setting-escape codes."""
-    tmux = os.getenv('TMUX')
-    term = (os.getenv('TERM') or os.getenv('TERMINAL'))
-    if tmux and len(tmux) > 0:
-        return '\033Ptmux;\033\033]4;{};rgb:{}\033\033\\\033\\'
-    elif term and term.startswith('screen'):
-        return '\033P\033]4;{};rgb:{}\033\\'
-    else:
-        return '\033]4;{};rgb:{}\033\\'
-
-def set_colors(colors):
+def set_colors(colors, backend=None):
     """Sets the terminal's color palette."""
-    tmp = _palette_template()
-    output = ''.join([tmp.format(i, c) for i, c in colors.items()])
-    print(output)
-    print(output, end='')
-
-def _style_template():
-    """Returns a template for setting targets like fg/bg/cs."""
-    tmux = os.getenv('TMUX')
-    term = (os.getenv('TERM') or os.getenv('TERMINAL'))
-    if tmux and len(tmux) > 0:
-        return '\033Ptmux;\033\033]{};rgb:{}\033\033\\\033\\'
-    elif term and term.startswith('screen'):
-        return '\033P\033]{};rgb:{}\033\\'
-    else:
-        return '\033]{};rgb:{}\033\\'
+    backend = backend or get_backend()
+    with timings.stage('set_colors'):
+        backend.emit(backend.palette(colors).encode('utf-8'))
 
-def set_style(colors, style):
+def set_style(colors, style, backend=None):
     """Sets fg/bg/cs for the terminal."""
-    style_n = {
-        'foreground': 10,
-        'background': 11,
-        'cursor': 12
-    }
-
-    tmp = _style_template()
-    output = ''.join([tmp.format(style_n[k], v) for k, v in style.items()])
-    print(output, end='')
+    backend = backend or get_backend()
+    with timings.stage('set_style'):
+        backend.emit(backend.style(style).encode('utf-8'))
+
+def _shown(backend, colors):
+    """Returns the (colors, style) the terminal reports for the slots in
+    `colors`, or None if it can't be asked or doesn't answer."""
+    from .snapshot import query
+    try:
+        shown = query(backend, sorted(int(i) for i in colors))
+    except OSError:  # no controlling terminal
+        return None
+    return shown if shown[0] else None
+
+def _broadcast(data_dir, scheme_name, style_name):
+    """Asks a running daemon to load the scheme in all other terminals."""
+    if not os.path.exists(os.path.join(data_dir, DAEMON_SOCKET)):
+        return
+    from .daemon import request
+    tty = state.controlling_tty()
+    reply = request(data_dir, {'op': 'load', 'scheme': scheme_name,
+                               'style': style_name,
+                               'exclude': [tty] if tty else []})
+    if reply is not None and not reply.get('ok'):
+        click.echo(reply.get('error'), err=True)
 
 @click.command()
-@click.option('--from-github', is_flag=True)
+@click.option('--from-repo', '--from-github', 'from_repo', is_flag=True,
+              help="fetch the scheme from the configured repository first")
+@click.option('--broadcast/--no-broadcast', default=True,
+              help="also load in terminals registered with the daemon")
+@click.option('--tty', is_flag=True,
+              help="write to /dev/tty instead of stdout")
+@click.option('--full', is_flag=True,
+              help="repaint every color, not just the ones that changed")
+@click.option('--transition', type=Duration(), metavar='DURATION',
+              help="fade from the current colors, e.g. 300ms")
 @click.argument('scheme', required=False)
 @click.argument('style', required=False)
 @click.pass_obj
-def load(user, from_github, scheme, style):
+def load(user, from_repo, broadcast, tty, full, transition, scheme, style):
     """Load schemes and styles."""
     scheme_name = scheme or user.settings['scheme_name']
     style_name = style or user.settings['style_name']
     style_name = style_name or DEFAULT_STYLE
 
-    if from_github:
-        _add_from_github(scheme_name)
-
-    try:
-        scheme = _resolve_colorscheme(user.data_dir, scheme_name, style_name)
-        colors = _resolve_colors(scheme)
-        style = _resolve_style(scheme, colors, style_name)
-    except ValueError:  # fail to resolve
-        raise
-
-    set_colors(colors)
-    set_style(colors, style)
-
-    user.settings['scheme_name'] = scheme_name
-    user.settings['style_name'] = style_name
-
-    user.save_settings()
+    if from_repo:
+        _add_from_repository(user, scheme_name)
+
+    # The compiled output depends on the terminal's escape templates.
+    backend = get_backend(tty='/dev/tty' if tty else None)
+    with timings.stage('scheme_path'):
+        path = _scheme_path(user.data_dir, scheme_name)
+    # Only send what differs from the palette this tty already shows.
+    dest = None
+    if not backend.passthrough:
+        dest = state.controlling_tty() if tty else state.stdout_tty()
+    with timings.stage('cache_lookup'):
+        if dest is not None or transition:  # the palette is needed too
+            output, colors, style = cache.lookup_resolved(
+                    user.data_dir, scheme_name, style_name,
+                    backend.template, path) or (None, None, None)
+        else:
+            output = cache.lookup(user.data_dir, scheme_name, style_name,
+                                  backend.template, path)
+            colors = style = None
+    recompiled = output is None
+    if recompiled:
+        try:
+            with timings.stage('resolve_colorscheme'):
+                scheme = _resolve_scheme(user.data_dir, scheme_name)
+            with timings.stage('resolve_colors'):
+                colors = scheme.colors()
+            with timings.stage('resolve_style'):
+                style = scheme.style(style_name).as_dict()
+        except ValueError:  # fail to resolve
+            raise
+        with timings.stage('payload'):
+            output = backend.payload(colors, style)
+        with timings.stage('cache_store'):
+            cache.store(user.data_dir, scheme_name, style_name,
+                        backend.template, path, colors, style, output,
+                        inherit.sources(user.data_dir, scheme_name))
+
+    applied = None
+    if dest is not None:
+        with timings.stage('state_diff'):
+            applied = state.read(user.data_dir, dest)
+            if applied is not None and not full:
+                output = backend.payload(*diff(applied[0], applied[1],
+                                               colors, style))
+
+    if transition and output:
+        from .transition import frames, play
+        with timings.stage('transition'):
+            start = applied or _shown(backend, colors)
+            if start is None:
+                click.echo("Can't read the terminal's current colors; "
+                           "loading without a transition.", err=True)
+            else:
+                play(backend, frames(backend, start, (colors, style),
+                                     transition), transition)
+    if output:
+        with timings.stage('emit'):
+            backend.emit(output)
+    if dest is not None and applied != (colors, style):
+        with timings.stage('state_write'):
+            state.write(user.data_dir, dest, colors, style)
+
+    if broadcast:
+        with timings.stage('broadcast'):
+            _broadcast(user.data_dir, scheme_name, style_name)
+
+    if (user.settings.get('scheme_name') != scheme_name or
+            user.settings.get('style_name') != style_name):
+        user.settings['scheme_name'] = scheme_name
+        user.settings['style_name'] = style_name
+        with timings.stage('save_settings'):
+            user.save_settings()
+
+    # Keep `compile`d shell snippets in step with what was loaded.
+    if os.path.isdir(os.path.join(user.data_dir, COMPILED_DIR)):
+        from .compile import refresh
+        with timings.stage('compile'):
+            refresh(user.data_dir, scheme_name, style_name, recompiled)
@@ -1,25 +1,99 @@
 import os
-import pkg_resources
 
 import click
 
 from .constants import *
+from .pack import open_pack, pack_path
+
+def _ls_similar(user, scheme_name, count):
+    from .index import SchemeIndex, features
+    from .load import _resolve_colorscheme
+    try:
+        target = features(_resolve_colorscheme(user.data_dir, scheme_name,
+                                               None))
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    index = SchemeIndex(user.data_dir)
+    # Start over if there is no usable index.
+    index.update(force=not index.load())
+    for distance, name in index.nearest(target, count, (scheme_name,)):
+        click.echo('{:<30} {:6.1f}'.format(name, distance))
+
+def _iter_schemes(user, scheme_set, prefix=''):
+    """Lazily yields (name, origin, path) for each visible scheme.
+
+    User schemes come first and shadow package schemes of the same name."""
+    seen = set()
+    packed = open_pack(user.data_dir)
+    sources = []
+    if scheme_set in ('user', 'all'):
+        sources.append(('user', user.data_dir))
+    if scheme_set in ('package', 'all'):
+        sources.append(('package', PKG_SCHEMES_DIR))
+    for origin, directory in sources:
+        for entry in os.scandir(directory):
+            name = entry.name[:-len(EXT)]
+            if (entry.name.endswith(EXT) and name.startswith(prefix)
+                    and name not in seen):
+                seen.add(name)
+                yield name, origin, entry.path
+        if packed is not None and origin == 'user':
+            for name, _ in packed.names(origin):
+                if name.startswith(prefix) and name not in seen:
+                    seen.add(name)
+                    yield name, origin, pack_path(user.data_dir)
+
+def _metadata(user, name, origin, path):
+    import json
+    from .inherit import extend
+    from .scheme import Scheme
+    info = {'name': name, 'origin': origin, 'path': path}
+    try:
+        if path == pack_path(user.data_dir):
+            scheme = open_pack(user.data_dir).get(name)
+        else:
+            with open(path, 'rt', encoding='utf-8') as f:
+                scheme = Scheme.from_dict(
+                        extend(user.data_dir, json.loads(f.read())), name)
+        info['styles'] = scheme.style_names()
+        info['colors'] = len(scheme)
+    except (ValueError, IOError, OSError, AttributeError) as err:
+        info['error'] = str(err)
+    return json.dumps(info)
 
 @click.command()
-@click.option('-q', help="machine-readable output")
+@click.option('-q', 'machine', is_flag=True,
+              help="machine-readable output (JSON Lines)")
 @click.option('--all', 'scheme_set', flag_value='all', help="show all schemes", default=True)
 @click.option('--user', 'scheme_set', flag_value='user', help="show user schemes only")
 @click.option('--package', 'scheme_set', flag_value='package', help="show package schemes only")
+@click.option('--similar-to', metavar='SCHEME',
+              help="list the schemes closest to SCHEME")
+@click.option('-n', 'count', type=click.IntRange(1), default=10,
+              show_default=True,
+              help="number of schemes to show with --similar-to")
+@click.option('--prefix', default='', help="only schemes starting with this")
+@click.option('--offset', type=click.IntRange(0), default=0,
+              help="skip this many schemes")
+@click.option('--limit', type=click.IntRange(0), default=None,
+              help="show at most this many schemes")
 @click.pass_obj
-def ls(user, q, scheme_set):
+def ls(user, machine, scheme_set, similar_to, count, prefix, offset, limit):
     """List schemes."""
-    user_schemes = [os.path.splitext(s)[0]
-            for s in os.listdir(user.data_dir) if s.endswith(EXT)]
-    package_schemes = [os.path.splitext(s)[0]
-            for s in pkg_resources.resource_listdir(__name__, PKG_SCHEMES)]
-    sections = []
-    if (scheme_set == 'user' or scheme_set == 'all') and user_schemes:
-        sections.append('User schemes:\n' + '\n'.join(user_schemes))
-    if scheme_set == 'package' or scheme_set == 'all':
-        sections.append('Package schemes:\n' + '\n'.join(package_schemes))
-    print('\n\n'.join(sections))
+    from itertools import islice
+    if similar_to:
+        _ls_similar(user, similar_to, count)
+        return
+    schemes = _iter_schemes(user, scheme_set, prefix)
+    stop = None if limit is None else offset + limit
+    heading = None
+    for name, origin, path in islice(schemes, offset, stop):
+        if machine:
+            click.echo(_metadata(user, name, origin, path))
+            continue
+        if origin != heading:
+            if heading is not None:
+                click.echo('')
+            click.echo('{} schemes:'.format(origin.capitalize()))
+            heading = origin
+        click.echo(name)
@@ -0,0 +1,257 @@
+"""Packed scheme database.
+
+`ansi-scheme pack` folds every user scheme into a single file,
+`<data_dir>/schemes.pack`, so `load` and `ls` can find schemes without a
+stat and an open per scheme (slow on NFS homes with thousands of them).
+Package schemes stay in the installed directory, where an upgrade can
+replace them; records of origin 'package' written by older versions are
+ignored.
+
+Layout (little-endian):
+    header   8s magic, H version, H slots, I record count
+    records  fixed-width, sorted by name:
+             64s name, B origin, I slot mask, 66s rgb (22 slots x 3 bytes),
+             I extra offset, I extra length
+    extras   JSON of everything but the colors (styles, default_style, ...)
+
+The file is memory-mapped and records are found by binary search.
+"""
+import os
+import mmap
+import struct
+
+import click
+
+from .constants import *
+
+PACK_FILE = 'schemes.pack'
+MAGIC = b'ANSIPACK'
+VERSION = 1
+SLOTS = 22
+HEADER = struct.Struct('<8sHHI')
+RECORD = struct.Struct('<64sBI{}sII'.format(SLOTS * 3))
+ORIGINS = ['user', 'package']
+
+# path: ((st_ino, st_mtime_ns, st_size), Pack or None)
+_open_packs = {}
+
+def pack_path(data_dir):
+    return os.path.join(data_dir, PACK_FILE)
+
+class Pack(object):
+    """A read-only view of a pack file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, slots, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or slots != SLOTS:
+            raise ValueError('{} is not a version {} scheme pack.'
+                             .format(path, VERSION))
+        if len(self.map) < HEADER.size + self.count * RECORD.size:
+            raise ValueError('{} is truncated.'.format(path))
+
+    def _name(self, i):
+        offset = HEADER.size + i * RECORD.size
+        return self.map[offset:offset + 64].rstrip(b'\0')
+
+    def _find(self, name):
+        """Returns the record index of `name`, or None."""
+        key = name.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.count and self._name(lo) == key else None
+
+    def __contains__(self, name):
+        return self._find(name) is not None
+
+    def origin(self, name):
+        """Returns where `name` was packed from, or None if it wasn't."""
+        i = self._find(name)
+        if i is None:
+            return None
+        return ORIGINS[self.map[HEADER.size + i * RECORD.size + 64]]
+
+    def names(self, origin=None):
+        """Yields (name, origin) in name order."""
+        for i in range(self.count):
+            offset = HEADER.size + i * RECORD.size
+            record_origin = ORIGINS[self.map[offset + 64]]
+            if origin is None or origin == record_origin:
+                yield self._name(i).decode('utf-8'), record_origin
+
+    def _extras(self, name):
+        """Returns (mask, rgb, extras dict) of `name`'s record.
+
+        Raises ValueError if it isn't in the pack."""
+        import json
+        i = self._find(name)
+        if i is None:
+            raise ValueError('{} is not in the pack.'.format(name))
+        _, _, mask, rgb, extra_offset, extra_len = RECORD.unpack_from(
+                self.map, HEADER.size + i * RECORD.size)
+        extras = json.loads(self.map[extra_offset:extra_offset + extra_len]
+                            .decode('utf-8'))
+        return mask, rgb, extras
+
+    def get(self, name):
+        """Returns the Scheme for `name`, built from the packed colors
+        (merged over its parents if it extends any).
+
+        Raises ValueError if it isn't in the pack."""
+        from .scheme import Scheme
+        mask, rgb, extras = self._extras(name)
+        if extras.get('extends'):
+            from .inherit import extend
+            extras['colors'] = Scheme(rgb, mask).colors(extended=False)
+            return Scheme.from_dict(
+                    extend(os.path.dirname(self.path), extras), name)
+        return Scheme(rgb, mask, extras.get('styles'),
+                      extras.get('default_style'), extras.get('palette'), name)
+
+    def scheme(self, name):
+        """Returns the scheme dict for `name`.
+
+        Raises ValueError if it isn't in the pack."""
+        from .scheme import Scheme
+        mask, rgb, scheme = self._extras(name)
+        scheme['colors'] = Scheme(rgb, mask).colors(extended=False)
+        return scheme
+
+def open_pack(data_dir):
+    """Returns the user's Pack, or None if there isn't a usable one.
+
+    Packs stay open for the life of the process and are reopened when the
+    file is replaced or changes, so long-running commands see new packs."""
+    path = pack_path(data_dir)
+    try:
+        st = os.stat(path)
+        key = (st.st_ino, st.st_mtime_ns, st.st_size)
+    except OSError:
+        key = None
+    cached = _open_packs.get(path)
+    if cached is None or cached[0] != key:
+        pack = None
+        if key is not None:
+            try:
+                pack = Pack(path)
+            except (IOError, OSError, ValueError, struct.error):
+                pass
+        cached = _open_packs[path] = key, pack
+    return cached[1]
+
+def _record(name, origin, scheme, extra_offset, extra):
+    """Packs one scheme. Raises ValueError for unpackable schemes."""
+    from .scheme import Scheme
+    encoded = name.encode('utf-8')
+    if len(encoded) > 64:
+        raise ValueError('name is longer than 64 bytes')
+    scheme = Scheme.from_dict(scheme, name)
+    if scheme.mask >> SLOTS:
+        raise ValueError('color {} does not fit in a pack'
+                         .format(max(scheme)))
+    return RECORD.pack(encoded, ORIGINS.index(origin), scheme.mask,
+                       scheme.rgb.ljust(SLOTS * 3, b'\0'),
+                       extra_offset, len(extra))
+
+def write_pack(path, schemes):
+    """Writes a pack of {name: (origin, scheme dict)}.
+
+    Returns {name: error} for the schemes that were left out."""
+    import json
+    entries, errors = [], {}
+    for name in sorted(schemes, key=lambda n: n.encode('utf-8')):
+        origin, scheme = schemes[name]
+        extra = json.dumps(dict((k, v) for k, v in scheme.items()
+                                if k != 'colors'),
+                           sort_keys=True).encode('utf-8')
+        try:
+            _record(name, origin, scheme, 0, extra)
+        except (ValueError, KeyError) as err:
+            errors[name] = str(err)
+            continue
+        entries.append((name, origin, scheme, extra))
+
+    # Extras follow the records, so their offsets are known up front.
+    offset = HEADER.size + len(entries) * RECORD.size
+    records = []
+    for name, origin, scheme, extra in entries:
+        records.append(_record(name, origin, scheme, offset, extra))
+        offset += len(extra)
+    data = b''.join([HEADER.pack(MAGIC, VERSION, SLOTS, len(records))] +
+                    records + [extra for _, _, _, extra in entries])
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+    _open_packs.pop(path, None)
+    return errors
+
+def _load_dir(directory, origin, schemes):
+    import json
+    for entry in os.scandir(directory):
+        if entry.name.endswith(EXT):
+            with open(entry.path, 'rt', encoding='utf-8') as f:
+                try:
+                    schemes[entry.name[:-len(EXT)]] = (origin,
+                                                       json.loads(f.read()))
+                except ValueError as err:
+                    click.echo('Skipping {}: {}'.format(entry.path, err),
+                               err=True)
+
+@click.command()
+@click.option('--keep', is_flag=True,
+              help="keep the user scheme files after packing")
+@click.pass_obj
+def pack(user, keep):
+    """Pack all user schemes into a single database file."""
+    schemes = {}
+    existing = open_pack(user.data_dir)
+    if existing is not None:  # repacking keeps what's already packed
+        for name, _ in existing.names('user'):
+            schemes[name] = ('user', existing.scheme(name))
+    user_files = {}
+    _load_dir(user.data_dir, 'user', user_files)
+    schemes.update(user_files)
+    errors = write_pack(pack_path(user.data_dir), schemes)
+    for name, error in sorted(errors.items()):
+        click.echo('Skipping {}: {}'.format(name, error), err=True)
+    if not keep:
+        for name in user_files:
+            if name not in errors:
+                os.remove(os.path.join(user.data_dir, name + EXT))
+    click.echo('Packed {} schemes.'.format(len(schemes) - len(errors)),
+               err=True)
+
+@click.command()
+@click.option('--package', 'include_package', is_flag=True,
+              help="also extract package schemes")
+@click.pass_obj
+def unpack(user, include_package):
+    """Extract packed user schemes back into files and remove the pack."""
+    import json
+    packed = open_pack(user.data_dir)
+    if packed is None:
+        raise click.ClickException('There is no scheme pack.')
+    for name, origin in packed.names():
+        path = os.path.join(user.data_dir, name + EXT)
+        if (origin == 'package' and not include_package) or \
+                os.path.exists(path):
+            continue
+        scheme = packed.scheme(name)
+        # Use color names where the file format has them.
+        scheme['colors'] = dict(
+            (COLORS[int(k)] if int(k) < len(COLORS) else k, v)
+            for k, v in scheme['colors'].items())
+        with open(path, 'w') as f:
+            json.dump(scheme, f, indent=2, sort_keys=True)
+        click.echo(name)
+    packed.map.close()
+    _open_packs.pop(pack_path(user.data_dir), None)
+    os.remove(pack_path(user.data_dir))
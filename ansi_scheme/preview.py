@@ -0,0 +1,195 @@
+"""Interactive scheme picker.
+
+Moving the cursor applies the highlighted scheme right away. Palettes are
+resolved ahead of time in a background thread, and only the slots that
+differ from what the terminal currently shows are sent. The terminal's own
+colors are read (see `snapshot.query`) before anything is applied and put
+back if the preview is left without picking a scheme.
+"""
+import os
+import threading
+
+import click
+
+from .constants import *
+from .load import _resolve_scheme
+from .snapshot import query
+from .terminal import get_backend, diff
+from . import state
+
+KEYS = {
+    b'j': 1, b'\x1b[B': 1, b'\x0e': 1,
+    b'k': -1, b'\x1b[A': -1, b'\x10': -1,
+    b'\x1b[6~': 10, b'\x1b[5~': -10,
+}
+
+class _Palettes(object):
+    """Resolves (colors, style) for every scheme in a background thread."""
+
+    def __init__(self, data_dir, names, style_name):
+        self.data_dir = data_dir
+        self.names = names
+        self.style_name = style_name
+        self.resolved = {}
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _resolve(self, name):
+        try:
+            scheme = _resolve_scheme(self.data_dir, name)
+            return (scheme.colors(),
+                    scheme.style(self.style_name).as_dict())
+        except (ValueError, KeyError):
+            return None
+
+    def _run(self):
+        for name in self.names:
+            with self.lock:
+                if name in self.resolved:
+                    continue
+            result = self._resolve(name)
+            with self.lock:
+                self.resolved.setdefault(name, result)
+
+    def get(self, name):
+        """Returns (colors, style), resolving now if the thread hasn't yet,
+        or None if the scheme can't be used."""
+        with self.lock:
+            if name in self.resolved:
+                return self.resolved[name]
+        result = self._resolve(name)
+        with self.lock:
+            return self.resolved.setdefault(name, result)
+
+class _Screen(object):
+    """Raw-mode tty with an alternate screen."""
+
+    def __init__(self):
+        import termios
+        self.fd = os.open('/dev/tty', os.O_RDWR | os.O_NOCTTY)
+        self.saved = termios.tcgetattr(self.fd)
+
+    def __enter__(self):
+        import tty
+        tty.setraw(self.fd)
+        self.write(b'\x1b[?1049h\x1b[?25l')
+        return self
+
+    def __exit__(self, *exc):
+        import termios
+        self.write(b'\x1b[?25h\x1b[?1049l')
+        termios.tcsetattr(self.fd, termios.TCSADRAIN, self.saved)
+        os.close(self.fd)
+
+    def size(self):
+        try:
+            columns, lines = os.get_terminal_size(self.fd)
+        except OSError:
+            columns, lines = 80, 24
+        return columns, lines
+
+    def write(self, data):
+        view = memoryview(data)
+        while view:
+            view = view[os.write(self.fd, view):]
+
+    def read_key(self):
+        return os.read(self.fd, 32)
+
+def _draw(screen, names, current, top, style_name, resolved):
+    columns, lines = screen.size()
+    rows = max(lines - 3, 1)
+    out = ['\x1b[H\x1b[2J']
+    for i, name in enumerate(names[top:top + rows], top):
+        marker = '\x1b[7m' if i == current else ''
+        missing = '' if resolved.get(name, True) else '  (unusable)'
+        out.append('{}{}\x1b[0m\r\n'.format(marker,
+                                             (name + missing)[:columns - 1]))
+    # A swatch of the palette slots schemes define.
+    out.append('\x1b[{};1H'.format(lines - 1))
+    out.append(''.join('\x1b[48;5;{}m  '.format(i) for i in range(22)))
+    status = '{} | j/k move  s style  enter keep  q quit'.format(style_name)
+    out.append('\x1b[0m\r\n' + status[:columns - 1])
+    return ''.join(out).encode('utf-8')
+
+@click.command()
+@click.argument('style', required=False)
+@click.pass_obj
+def preview(user, style):
+    """Browse schemes, applying each one as the cursor moves."""
+    from .ls import _iter_schemes
+    names = [name for name, _, _ in _iter_schemes(user, 'all')]
+    if not names:
+        raise click.ClickException('No schemes found.')
+    original = (user.settings.get('scheme_name') or 'default',
+                user.settings.get('style_name') or DEFAULT_STYLE)
+    styles = sorted(DEFAULT_STYLES)
+    style_name = style or original[1]
+    current = names.index(original[0]) if original[0] in names else 0
+
+    backend = get_backend()
+    palettes = _Palettes(user.data_dir, names, style_name)
+    tty = None if backend.passthrough else state.controlling_tty()
+    try:
+        before = query(backend, list(range(22)))
+    except OSError:
+        before = ({}, {})
+    # What the terminal is showing, if known.
+    applied = (before if before[0] else
+               state.read(user.data_dir, tty) or (None, None))
+
+    def apply(screen, target):
+        """Sends only the slots of `target` that differ from `applied`."""
+        colors, style_ = diff(applied[0], applied[1], *target)
+        if colors or style_:
+            screen.write(backend.payload(colors, style_))
+        return target
+
+    accepted = False
+    with _Screen() as screen:
+        top = 0
+        while True:
+            target = palettes.get(names[current])
+            if target is not None:
+                applied = apply(screen, target)
+            rows = max(screen.size()[1] - 3, 1)
+            top = min(max(top, current - rows + 1), current)
+            screen.write(_draw(screen, names, current, top, style_name,
+                               palettes.resolved))
+            key = screen.read_key()
+            if key in KEYS:
+                current = min(max(current + KEYS[key], 0), len(names) - 1)
+            elif key in (b'g', b'\x1b[H'):
+                current = 0
+            elif key in (b'G', b'\x1b[F'):
+                current = len(names) - 1
+            elif key == b's':
+                style_name = styles[(styles.index(style_name) + 1) %
+                                    len(styles)] \
+                    if style_name in styles else styles[0]
+                palettes = _Palettes(user.data_dir, names, style_name)
+            elif key in (b'\r', b'\n'):
+                accepted = True
+                break
+            elif key in (b'q', b'\x1b', b'\x03'):
+                break
+
+        if not accepted:
+            # Put back what the terminal showed, or failing that (it didn't
+            # answer) what `load` last applied.
+            target = before
+            if not before[0]:
+                target = _Palettes(user.data_dir, [], original[1]).get(
+                        original[0])
+            if target is not None:
+                applied = apply(screen, target)
+    if applied[0] is not None and tty is not None:
+        state.write(user.data_dir, tty, *applied)
+
+    if accepted:
+        user.settings['scheme_name'] = names[current]
+        user.settings['style_name'] = style_name
+        user.save_settings()
+        click.echo(names[current])
@@ -0,0 +1,269 @@
+"""Application configs rendered from a scheme.
+
+`ansi-scheme render <target>` fills a `string.Template` with the resolved
+palette and style: `$color0`-`$color21`, `$foreground`, `$background` and
+`$cursor` as "#rrggbb", plus `$scheme`, `$style` (with control characters
+replaced, so they can't end a comment line) and a few per-target extras.
+Templates are compiled once per process, and rendered output goes through
+the compiled-output cache keyed on (scheme, style, target, template
+version), so re-rendering a whole library only renders what changed.
+"""
+import os
+
+import click
+
+from .constants import *
+from . import cache, inherit
+
+# target -> (template version, file extension, template)
+TEMPLATES = {
+    'vim': ('2', 'vim', '''\
+" $scheme ($style), generated by `ansi-scheme render vim`.
+set background=$vim_background
+hi clear
+if exists('syntax_on')
+  syntax reset
+endif
+let g:colors_name = $vim_colors_name
+let g:terminal_ansi_colors = [$terminal_ansi_colors]
+hi Normal       guifg=$foreground guibg=$background ctermfg=NONE ctermbg=NONE
+hi Cursor       guifg=$background guibg=$cursor
+hi Comment      guifg=$color8  ctermfg=8
+hi Constant     guifg=$color1  ctermfg=1
+hi String       guifg=$color2  ctermfg=2
+hi PreProc      guifg=$color3  ctermfg=3
+hi Identifier   guifg=$color4  ctermfg=4
+hi Statement    guifg=$color5  ctermfg=5
+hi Type         guifg=$color6  ctermfg=6
+hi Special      guifg=$color9  ctermfg=9
+hi Error        guifg=$color15 guibg=$color1 ctermfg=15 ctermbg=1
+hi Todo         guifg=$color0  guibg=$color11 ctermfg=0 ctermbg=11
+hi Visual       guifg=$background guibg=$color12 ctermfg=0 ctermbg=12
+hi Search       guifg=$background guibg=$color3 ctermfg=0 ctermbg=3
+hi LineNr       guifg=$color8  ctermfg=8
+hi CursorLineNr guifg=$foreground ctermfg=NONE
+hi StatusLine   guifg=$background guibg=$foreground cterm=reverse
+hi StatusLineNC guifg=$color8 guibg=$background ctermfg=8
+hi VertSplit    guifg=$color8  ctermfg=8
+hi Pmenu        guifg=$foreground guibg=$color0 ctermfg=NONE ctermbg=0
+hi PmenuSel     guifg=$background guibg=$color4 ctermfg=0 ctermbg=4
+hi DiffAdd      guifg=$color2  ctermfg=2
+hi DiffChange   guifg=$color3  ctermfg=3
+hi DiffDelete   guifg=$color1  ctermfg=1
+'''),
+    'tmux': ('2', 'conf', '''\
+# $scheme ($style), generated by `ansi-scheme render tmux`.
+set -g status-style "fg=$foreground,bg=$background"
+set -g window-status-style "fg=$color8,bg=$background"
+set -g window-status-current-style "fg=$background,bg=$color4"
+set -g pane-border-style "fg=$color8"
+set -g pane-active-border-style "fg=$color4"
+set -g message-style "fg=$foreground,bg=$background"
+set -g mode-style "fg=$background,bg=$color3"
+set -g clock-mode-colour "$color4"
+'''),
+    'fzf': ('2', 'sh', '''\
+# $scheme ($style), generated by `ansi-scheme render fzf`.
+export FZF_DEFAULT_OPTS="$$FZF_DEFAULT_OPTS --color=fg:$foreground,\
+bg:$background,hl:$color4,fg+:$foreground,bg+:$color0,hl+:$color12,\
+info:$color3,prompt:$color5,pointer:$color1,marker:$color2,spinner:$color6,\
+header:$color8"
+'''),
+    'kitty': ('2', 'conf', '''\
+# $scheme ($style), generated by `ansi-scheme render kitty`.
+foreground $foreground
+background $background
+cursor $cursor
+cursor_text_color $background
+selection_foreground $background
+selection_background $foreground
+color0 $color0
+color1 $color1
+color2 $color2
+color3 $color3
+color4 $color4
+color5 $color5
+color6 $color6
+color7 $color7
+color8 $color8
+color9 $color9
+color10 $color10
+color11 $color11
+color12 $color12
+color13 $color13
+color14 $color14
+color15 $color15
+'''),
+    'alacritty': ('2', 'toml', '''\
+# $scheme ($style), generated by `ansi-scheme render alacritty`.
+[colors.primary]
+foreground = "$foreground"
+background = "$background"
+
+[colors.cursor]
+cursor = "$cursor"
+text = "$background"
+
+[colors.normal]
+black = "$color0"
+red = "$color1"
+green = "$color2"
+yellow = "$color3"
+blue = "$color4"
+magenta = "$color5"
+cyan = "$color6"
+white = "$color7"
+
+[colors.bright]
+black = "$color8"
+red = "$color9"
+green = "$color10"
+yellow = "$color11"
+blue = "$color12"
+magenta = "$color13"
+cyan = "$color14"
+white = "$color15"
+'''),
+}
+
+_compiled = {}
+
+def _template(target):
+    """Returns the compiled string.Template for `target`."""
+    if target not in _compiled:
+        from string import Template
+        _compiled[target] = Template(TEMPLATES[target][2])
+    return _compiled[target]
+
+def _cache_key(target):
+    return 'render\0{}\0{}'.format(target, TEMPLATES[target][0])
+
+def _hex(value):
+    return '#' + value.replace('/', '')
+
+def _one_line(name):
+    return ''.join(c if c.isprintable() else '?' for c in name)
+
+def _vim_string(value):
+    """Returns `value` as a double-quoted Vim string literal."""
+    return '"{}"'.format(''.join(
+            '\\' + c if c in '"\\' else
+            c if c.isprintable() else '\\U{:08x}'.format(ord(c))
+            for c in value))
+
+def variables(scheme_name, style_name, colors, style):
+    """Returns the template variables for a resolved palette.
+
+    Raises ValueError if the style has no foreground or background."""
+    from .color import luminance, parse_rgb
+    for key in ('foreground', 'background'):
+        if key not in style:
+            raise ValueError("Style '{}' has no {}.".format(style_name, key))
+    values = {'scheme': _one_line(scheme_name),
+              'style': _one_line(style_name),
+              'vim_colors_name': _vim_string(scheme_name)}
+    for slot in range(22):
+        values['color{}'.format(slot)] = _hex(colors[str(slot)])
+    for key, value in style.items():
+        values[key] = _hex(value)
+    values.setdefault('cursor', values['foreground'])
+    dark = luminance([parse_rgb(style['background'])])[0] < 0.18
+    values['vim_background'] = 'dark' if dark else 'light'
+    values['terminal_ansi_colors'] = ', '.join(
+            "'{}'".format(values['color{}'.format(i)]) for i in range(16))
+    return values
+
+def _resolve(data_dir, scheme_name, style_name):
+    """Returns (colors, style) with missing slots taken from the defaults.
+
+    Raises ValueError if the scheme or style is unavailable."""
+    from .load import _resolve_scheme
+    from .scheme import default
+    scheme = _resolve_scheme(data_dir, scheme_name).merged(default())
+    return scheme.colors(), scheme.style(style_name).as_dict()
+
+def render(data_dir, target, scheme_name, style_name):
+    """Returns (rendered bytes, whether it was rendered afresh).
+
+    Raises ValueError if the scheme or style is unavailable."""
+    from .load import _scheme_path
+    path = _scheme_path(data_dir, scheme_name)
+    key = _cache_key(target)
+    output = cache.lookup(data_dir, scheme_name, style_name, key, path)
+    if output is not None:
+        return output, False
+    colors, style = _resolve(data_dir, scheme_name, style_name)
+    try:
+        output = _template(target).substitute(
+                variables(scheme_name, style_name, colors, style))
+    except KeyError as err:
+        raise ValueError('The {} template needs {}.'.format(target, err))
+    output = output.encode('utf-8')
+    cache.store(data_dir, scheme_name, style_name, key, path, colors, style,
+                output, inherit.sources(data_dir, scheme_name))
+    return output, True
+
+def _write_if_changed(path, output):
+    """Writes `output` to `path` unless it already holds exactly that."""
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == output:
+                return False
+    except (IOError, OSError):
+        pass
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'wb') as f:
+        f.write(output)
+    os.replace(tmp, path)
+    return True
+
+@click.command('render')
+@click.option('--all', 'render_all', is_flag=True,
+              help="render every scheme into the -o directory")
+@click.option('-o', '--output', type=click.Path(),
+              help="file (or directory with --all) to write to")
+@click.argument('target', type=click.Choice(sorted(TEMPLATES)))
+@click.argument('scheme', required=False)
+@click.argument('style', required=False)
+@click.pass_obj
+def render_(user, render_all, output, target, scheme, style):
+    """Render a scheme as configuration for another application.
+
+    With --all, every scheme is rendered and the argument after TARGET is
+    the style."""
+    if render_all:
+        if scheme and style:
+            raise click.UsageError('--all takes no SCHEME.')
+        style, scheme = scheme, None
+    style_name = style or user.settings['style_name'] or DEFAULT_STYLE
+    if not render_all:
+        scheme_name = scheme or user.settings['scheme_name']
+        try:
+            data, _ = render(user.data_dir, target, scheme_name, style_name)
+        except ValueError as err:
+            raise click.ClickException(str(err))
+        if output:
+            _write_if_changed(output, data)
+        else:
+            click.echo(data.decode('utf-8'), nl=False)
+        return
+
+    from .ls import _iter_schemes
+    if not output:
+        raise click.UsageError('--all needs -o DIRECTORY.')
+    if not os.path.isdir(output):
+        os.makedirs(output)
+    extension = TEMPLATES[target][1]
+    rendered = written = 0
+    for name, _, _ in _iter_schemes(user, 'all'):
+        try:
+            data, fresh = render(user.data_dir, target, name, style_name)
+        except (ValueError, KeyError) as err:
+            click.echo('Skipping {}: {}'.format(name, err), err=True)
+            continue
+        rendered += fresh
+        written += _write_if_changed(
+                os.path.join(output, '{}.{}.{}'.format(name, style_name,
+                                                       extension)), data)
+    click.echo('Rendered {}, wrote {} files.'.format(rendered, written),
+               err=True)
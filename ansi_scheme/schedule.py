@@ -0,0 +1,269 @@
+"""Rule-driven scheme switching inside the daemon.
+
+`ansi-scheme daemon --schedule` reads `<data_dir>/schedule.json`:
+
+    {"rules": [
+        {"from": "08:00", "to": "18:00", "style": "light"},
+        {"ssh_host": "prod-*", "scheme": "atelier-heath"}
+    ]}
+
+Each terminal starts from the scheme and style in the settings; every rule
+whose conditions all hold then overrides the fields it sets, later rules
+winning. `from`/`to` is a local time window (it may wrap past midnight);
+`ssh_host` is a glob matched against the hosts of ssh clients running on the
+terminal (found through /proc, so only on Linux).
+
+The scheduler sleeps until the next window boundary, resolves what that
+boundary will apply beforehand and pushes it to the affected terminals at
+the boundary. Terminals keep whatever was loaded by hand until their
+scheduled scheme next changes. With ssh rules the terminals are polled
+instead.
+"""
+import os
+import json
+import fnmatch
+import datetime
+
+SCHEDULE_FILE = 'schedule.json'
+# Re-check at least this often (suspend, clock changes, edited rules).
+MAX_SLEEP = 300
+SSH_POLL = 5
+
+# ssh options that take an argument
+_SSH_ARG_OPTIONS = 'BbcDEeFIiJLlmOoPpQRSWw'
+
+def schedule_path(data_dir):
+    return os.path.join(data_dir, SCHEDULE_FILE)
+
+def _parse_time(value):
+    """Returns minutes past midnight for "HH:MM". Raises ValueError."""
+    try:
+        hours, minutes = value.split(':')
+        hours, minutes = int(hours), int(minutes)
+    except (AttributeError, ValueError):
+        raise ValueError('{!r} is not a time like 08:00.'.format(value))
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError('{!r} is not a time like 08:00.'.format(value))
+    return hours * 60 + minutes
+
+class Rule(object):
+    def __init__(self, rule):
+        """Raises ValueError if the rule is malformed."""
+        if not isinstance(rule, dict):
+            raise ValueError('{!r} is not a rule.'.format(rule))
+        self.scheme = rule.get('scheme')
+        self.style = rule.get('style')
+        if self.scheme is None and self.style is None:
+            raise ValueError('Rule {!r} sets neither a scheme nor a style.'
+                             .format(rule))
+        if ('from' in rule) != ('to' in rule):
+            raise ValueError('Rule {!r} needs both "from" and "to".'
+                             .format(rule))
+        self.window = None
+        if 'from' in rule:
+            self.window = (_parse_time(rule['from']), _parse_time(rule['to']))
+        self.ssh_host = rule.get('ssh_host')
+
+    def matches(self, minute, hosts):
+        if self.window is not None:
+            start, end = self.window
+            if start <= end:
+                inside = start <= minute < end
+            else:  # wraps past midnight
+                inside = minute >= start or minute < end
+            if not inside:
+                return False
+        if self.ssh_host is not None:
+            return any(fnmatch.fnmatch(host, self.ssh_host) for host in hosts)
+        return True
+
+def load_rules(path):
+    """Returns the list of Rules in `path`. Raises ValueError."""
+    with open(path, 'rt') as f:
+        data = json.loads(f.read())
+    return [Rule(rule) for rule in data.get('rules', [])]
+
+def evaluate(rules, base, now, hosts=()):
+    """Returns the (scheme, style) the rules pick at datetime `now`."""
+    scheme_name, style_name = base
+    minute = now.hour * 60 + now.minute
+    for rule in rules:
+        if rule.matches(minute, hosts):
+            scheme_name = rule.scheme or scheme_name
+            style_name = rule.style or style_name
+    return scheme_name, style_name
+
+def next_boundary(rules, now):
+    """Returns the datetime of the next window edge after `now`, or None."""
+    edges = set()
+    for rule in rules:
+        if rule.window is not None:
+            edges.update(rule.window)
+    if not edges:
+        return None
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    candidates = []
+    for day in (0, 1):
+        for minute in edges:
+            # Construct through a timedelta so DST days still line up.
+            at = midnight + datetime.timedelta(days=day, minutes=minute)
+            if at > now:
+                candidates.append(at)
+    return min(candidates)
+
+def _ssh_host(argv):
+    """Returns the destination host of an ssh command line, or None."""
+    args = iter(argv[1:])
+    for arg in args:
+        if arg == '--':
+            arg = next(args, None)
+            break
+        if arg.startswith('-') and len(arg) > 1:
+            # As getopt does: the first letter that takes a value takes the
+            # rest of the word (-p22, -vp22), or the next word if it ends
+            # the group (-p 22, -vp 22).
+            for i, letter in enumerate(arg[1:], 2):
+                if letter in _SSH_ARG_OPTIONS:
+                    if i == len(arg):
+                        next(args, None)
+                    break
+            continue
+        break
+    else:
+        return None
+    if arg is None:
+        return None
+    if arg.startswith('ssh://'):
+        return arg[len('ssh://'):].rsplit('@', 1)[-1].split(':')[0]
+    return arg.rsplit('@', 1)[-1]
+
+def ssh_hosts():
+    """Returns {tty device number: set of ssh hosts} from /proc."""
+    hosts = {}
+    try:
+        pids = [pid for pid in os.listdir('/proc') if pid.isdigit()]
+    except OSError:
+        return hosts
+    for pid in pids:
+        try:
+            with open('/proc/{}/cmdline'.format(pid), 'rb') as f:
+                argv = f.read().split(b'\0')
+            if os.path.basename(argv[0]) != b'ssh':
+                continue
+            with open('/proc/{}/stat'.format(pid), 'rb') as f:
+                stat = f.read()
+            # Fields after the parenthesised command name; tty_nr is the 7th.
+            tty_nr = int(stat[stat.rindex(b')') + 2:].split()[4])
+        except (IOError, OSError, ValueError, IndexError):  # exited meanwhile
+            continue
+        host = _ssh_host([arg.decode('utf-8', 'replace')
+                          for arg in argv if arg])
+        if tty_nr and host:
+            hosts.setdefault(tty_nr, set()).add(host)
+    return hosts
+
+def _tty_hosts(tty, hosts):
+    try:
+        return hosts.get(os.stat(tty).st_rdev, ())
+    except OSError:
+        return ()
+
+class Scheduler(object):
+    """Applies the schedule to a Daemon's terminals."""
+
+    def __init__(self, daemon):
+        import asyncio
+        self.daemon = daemon
+        self.path = schedule_path(daemon.data_dir)
+        self.rules = load_rules(self.path)
+        self.signature = self._signature()
+        # tty -> (scheme, style) the schedule last applied
+        self.applied = {}
+        self.wake = asyncio.Event()
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _reload(self):
+        signature = self._signature()
+        if signature != self.signature:
+            self.signature = signature
+            try:
+                self.rules = load_rules(self.path)
+            except (IOError, OSError, ValueError):
+                pass  # keep the last good rules
+
+    def _base(self):
+        from .constants import DEFAULT_STYLE
+        try:
+            with open(os.path.join(self.daemon.data_dir, 'settings.json')) \
+                    as f:
+                settings = json.load(f)
+        except (IOError, OSError, ValueError):
+            settings = {}
+        return (settings.get('scheme_name') or 'default',
+                settings.get('style_name') or DEFAULT_STYLE)
+
+    def targets(self, now, hosts):
+        """Returns {tty: (scheme, style)} for the registered terminals,
+        given `ssh_hosts()`."""
+        base = self._base()
+        return dict((tty, evaluate(self.rules, base, now,
+                                   _tty_hosts(tty, hosts)))
+                    for tty in self.daemon.terminals)
+
+    def _prepare(self, targets):
+        """Resolves and renders what `targets` will need."""
+        for tty, (scheme_name, style_name) in targets.items():
+            kind = self.daemon.terminals.get(tty)
+            if kind is None:
+                continue
+            try:
+                self.daemon._payload(scheme_name, style_name, kind)
+            except ValueError:
+                pass  # reported when applied
+
+    async def apply(self, targets):
+        groups = {}
+        for tty, target in targets.items():
+            if self.applied.get(tty) != target:
+                groups.setdefault(target, []).append(tty)
+        for (scheme_name, style_name), ttys in groups.items():
+            try:
+                await self.daemon.broadcast(scheme_name, style_name,
+                                            only=ttys)
+            except ValueError as err:
+                import click
+                click.echo('Schedule: {}'.format(err), err=True)
+            for tty in ttys:
+                self.applied[tty] = (scheme_name, style_name)
+        for tty in set(self.applied) - set(self.daemon.terminals):
+            del self.applied[tty]
+
+    async def run(self):
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            self._reload()
+            # Scanning /proc blocks; keep it off the event loop.
+            hosts = (await loop.run_in_executor(None, ssh_hosts)
+                     if any(r.ssh_host for r in self.rules) else {})
+            await self.apply(self.targets(datetime.datetime.now(), hosts))
+            now = datetime.datetime.now()
+            boundary = next_boundary(self.rules, now)
+            timeout = MAX_SLEEP
+            if boundary is not None:
+                timeout = min(timeout, (boundary - now).total_seconds())
+                # Resolve the boundary's schemes now, not at the boundary.
+                self._prepare(self.targets(boundary, hosts))
+            if any(r.ssh_host for r in self.rules):
+                timeout = min(timeout, SSH_POLL)
+            self.wake.clear()
+            try:
+                await asyncio.wait_for(self.wake.wait(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
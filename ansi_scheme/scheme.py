@@ -0,0 +1,211 @@
+"""Compact, immutable schemes.
+
+A `Scheme` keeps its palette as one bytes buffer of packed (r, g, b) triples
+plus a bitmask of the slots it defines, so a 22-slot scheme costs 66 bytes
+of color data. Color names and slot numbers are mapped to indices through a
+table built once at import, and every color string is parsed exactly once,
+when the scheme is built.
+
+    >>> from ansi_scheme import Scheme
+    >>> scheme = Scheme.from_dict({'colors': {'Black': '1d1f21', ...}})
+    >>> scheme.hex(0)
+    '1d/1f/21'
+    >>> scheme.style('dark').as_dict()
+    {'foreground': ..., 'background': ..., 'cursor': ...}
+"""
+import re
+
+from .constants import COLORS, DEFAULT_SCHEME, DEFAULT_STYLES
+
+# Lowercased color name or slot number -> palette index.
+INDEX = dict((name.lower(), i) for i, name in enumerate(COLORS))
+INDEX.update((str(i), i) for i in range(256))
+
+STYLE_KEYS = ('foreground', 'background', 'cursor')
+
+_HEX_DIGIT = re.compile('[0-9a-fA-F]')
+
+def parse_hex(value):
+    """Returns the (r, g, b) bytes for the first 6 hex digits in `value`.
+
+    Raises ValueError if there aren't that many."""
+    digits = _HEX_DIGIT.findall(value)
+    if len(digits) < 6:
+        raise ValueError('Not enough hex values in "{}".'.format(value))
+    return bytes.fromhex(''.join(digits[:6]))
+
+def _slot(key):
+    """Returns the palette index for a color name or number."""
+    try:
+        return INDEX[key.lower()]
+    except (KeyError, AttributeError):
+        raise ValueError('{} is not a recognized color.'.format(key))
+
+def _format(rgb):
+    return '{:02x}/{:02x}/{:02x}'.format(*rgb)
+
+class Style(object):
+    """Resolved foreground/background/cursor, each 3 bytes or None."""
+    __slots__ = ('name', 'foreground', 'background', 'cursor')
+
+    def __init__(self, name, foreground=None, background=None, cursor=None):
+        self.name = name
+        self.foreground = foreground
+        self.background = background
+        self.cursor = cursor
+
+    def as_dict(self):
+        """Returns {key: "ab/cd/ef"} for the keys that are set."""
+        return dict((k, _format(getattr(self, k))) for k in STYLE_KEYS
+                    if getattr(self, k) is not None)
+
+    def __repr__(self):
+        return 'Style({!r}, {})'.format(self.name, self.as_dict())
+
+class Scheme(object):
+    """An immutable palette plus the style specs that go with it."""
+    __slots__ = ('name', 'mask', 'rgb', 'styles', 'default_style',
+                 'palette', '_extended')
+
+    def __init__(self, rgb, mask, styles=None, default_style=None,
+                 palette=None, name=None):
+        self.name = name
+        self.rgb = bytes(rgb)
+        self.mask = mask
+        self.styles = styles or {}
+        self.default_style = default_style
+        self.palette = palette
+        self._extended = None
+
+    @classmethod
+    def from_dict(cls, data, name=None):
+        """Builds a Scheme from a parsed .ansischeme dict.
+
+        Raises ValueError if a color can't be parsed."""
+        try:
+            colors = data['colors']
+        except (KeyError, TypeError):
+            raise ValueError('{} has no colors.'.format(name or 'The scheme'))
+        slots = [(_slot(k), parse_hex(v)) for k, v in colors.items()]
+        size = max([slot for slot, _ in slots] or [-1]) + 1
+        rgb, mask = bytearray(size * 3), 0
+        for slot, value in slots:
+            rgb[slot * 3:slot * 3 + 3] = value
+            mask |= 1 << slot
+        return cls(rgb, mask, data.get('styles'), data.get('default_style'),
+                   data.get('palette'), name)
+
+    def __contains__(self, slot):
+        return bool(self.mask >> slot & 1)
+
+    def __len__(self):
+        return bin(self.mask).count('1')
+
+    def __iter__(self):
+        """Yields the defined slot numbers in order."""
+        mask, slot = self.mask, 0
+        while mask:
+            if mask & 1:
+                yield slot
+            mask >>= 1
+            slot += 1
+
+    def __repr__(self):
+        return '<Scheme {!r}: {} colors>'.format(self.name, len(self))
+
+    def _generated(self):
+        """Returns slots 16-255 generated for `"palette": 256` schemes as a
+        768-byte buffer indexed like `rgb` (or None)."""
+        if self.palette != 256:
+            return None
+        if self._extended is None:
+            from .color import extended_palette
+            base = default().colors() if self is not default() else {}
+            base.update(self._explicit())
+            generated = extended_palette(base)
+            self._extended = bytes(b for slot in range(256)
+                                   for b in (parse_hex(generated[str(slot)])
+                                             if str(slot) in generated
+                                             else b'\0\0\0'))
+        return self._extended
+
+    def get(self, slot, extended=True):
+        """Returns the 3 bytes of `slot`, or None if it isn't defined."""
+        if self.mask >> slot & 1:
+            return self.rgb[slot * 3:slot * 3 + 3]
+        generated = self._generated() if extended and slot >= 16 else None
+        if generated is not None and slot < 256:
+            return generated[slot * 3:slot * 3 + 3]
+        return None
+
+    def hex(self, slot, extended=True):
+        """Returns "ab/cd/ef" for `slot`. Raises KeyError if undefined."""
+        value = self.get(slot, extended)
+        if value is None:
+            raise KeyError(slot)
+        return _format(value)
+
+    def _explicit(self):
+        return dict((str(slot), _format(self.rgb[slot * 3:slot * 3 + 3]))
+                    for slot in self)
+
+    def colors(self, extended=True):
+        """Returns {"i": "ab/cd/ef"}, the resolved colors used elsewhere.
+
+        Includes generated slots for `"palette": 256` schemes unless
+        `extended` is False."""
+        colors = self._explicit()
+        generated = self._generated() if extended else None
+        if generated is not None:
+            for slot in range(16, 256):
+                colors.setdefault(str(slot),
+                                  _format(generated[slot * 3:slot * 3 + 3]))
+        return colors
+
+    def merged(self, defaults):
+        """Returns a Scheme with the slots this one lacks from `defaults`."""
+        size = max(len(self.rgb), len(defaults.rgb))
+        rgb = bytearray(size)
+        rgb[:len(defaults.rgb)] = defaults.rgb
+        for slot in self:
+            rgb[slot * 3:slot * 3 + 3] = self.rgb[slot * 3:slot * 3 + 3]
+        return Scheme(rgb, self.mask | defaults.mask, self.styles,
+                      self.default_style, self.palette, self.name)
+
+    def style_names(self):
+        names = set(DEFAULT_STYLES)
+        names.update(self.styles)
+        return sorted(names)
+
+    def style(self, style_name):
+        """Returns the resolved Style.
+
+        Raises ValueError if the style is unavailable or refers to a color
+        the scheme doesn't define."""
+        spec = self.styles.get(style_name, DEFAULT_STYLES.get(style_name))
+        if spec is None:
+            raise ValueError("Style '{}' is not defined for this scheme."
+                             .format(style_name))
+        return Style(style_name, **dict(
+                (k, style_value(self.get, v)) for k, v in spec.items()))
+
+def style_value(lookup, value):
+    """Resolves a style value: hex, a color name or a slot number.
+
+    `lookup(slot)` returns the slot's bytes or None. Raises ValueError."""
+    try:
+        return parse_hex(value)
+    except ValueError:  # Not a hex value.
+        pass
+    rgb = lookup(_slot(value))
+    if rgb is None:
+        raise ValueError('{} is not a defined color.'.format(value))
+    return rgb
+
+_default = []
+
+def default():
+    """Returns the built-in default Scheme."""
+    if not _default:
+        _default.append(Scheme.from_dict(DEFAULT_SCHEME, 'default'))
+    return _default[0]
@@ -0,0 +1,167 @@
+"""Reading back the colors a terminal shows.
+
+`snapshot` asks the terminal for palette slots (OSC 4) and fg/bg/cursor
+(OSC 10/11/12) in a single write, wrapped for screen/tmux like everything
+else the backend sends, and collects the replies from the tty with `select`
+under one overall deadline. The result is saved as a user scheme whose
+`snapshot` style holds whichever of fg/bg/cursor were reported. `restore`
+sends it back like `load` would, but leaves the configured scheme alone.
+"""
+import os
+import re
+import time
+
+import click
+
+from .constants import *
+from .terminal import STYLE_TARGETS, get_backend
+from . import state
+
+SNAPSHOT_STYLE = 'snapshot'
+# Primary device attributes: every terminal answers, after earlier replies.
+_SENTINEL = b'\033[c'
+_REPLY = re.compile(br'\033\](4;(\d+)|1[012]);rgb:([0-9a-fA-F]{1,4})/'
+                    br'([0-9a-fA-F]{1,4})/([0-9a-fA-F]{1,4})')
+_DA_REPLY = re.compile(br'\033\[\?[0-9;]*c')
+_TARGETS = dict((str(n).encode('ascii'), k) for k, n in STYLE_TARGETS.items())
+
+def _channel(digits):
+    """Scales a 1-4 digit hex channel to a byte."""
+    return int(round(int(digits, 16) * 255.0 / (16 ** len(digits) - 1)))
+
+def parse_replies(data):
+    """Returns (colors, style) found in the terminal's replies."""
+    colors, style = {}, {}
+    for match in _REPLY.finditer(data):
+        what, slot, r, g, b = match.groups()
+        value = '{:02x}/{:02x}/{:02x}'.format(_channel(r), _channel(g),
+                                              _channel(b))
+        if slot is not None:
+            colors[slot.decode('ascii')] = value
+        else:
+            style[_TARGETS[what]] = value
+    return colors, style
+
+def query(backend, slots, timeout=1.0):
+    """Returns the (colors, style) the terminal reports.
+
+    Everything is asked in one write; replies are read until they are all
+    in, the terminal has answered the trailing sentinel, or `timeout`
+    seconds have passed in total."""
+    import select
+    import termios
+    fd = os.open('/dev/tty', os.O_RDWR | os.O_NOCTTY)
+    saved = termios.tcgetattr(fd)
+    try:
+        # No echo and no line buffering, so replies arrive as they come.
+        attrs = termios.tcgetattr(fd)
+        attrs[3] &= ~(termios.ICANON | termios.ECHO)
+        attrs[6][termios.VMIN], attrs[6][termios.VTIME] = 0, 0
+        termios.tcsetattr(fd, termios.TCSANOW, attrs)
+
+        # tmux and screen answer the sentinel themselves, ahead of the
+        # outer terminal's replies.
+        sentinel = not backend.passthrough
+        request = backend.query(slots) + (_SENTINEL if sentinel else b'')
+        view = memoryview(request)
+        while view:
+            view = view[os.write(fd, view):]
+
+        expected = len(slots) + len(STYLE_TARGETS)
+        deadline = time.monotonic() + timeout
+        data = b''
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                break
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                break
+            data += chunk
+            # With a sentinel, wait for it so its reply isn't left behind.
+            if (_DA_REPLY.search(data) if sentinel else
+                    len(_REPLY.findall(data)) >= expected):
+                break
+    finally:
+        termios.tcsetattr(fd, termios.TCSAFLUSH, saved)
+        os.close(fd)
+    return parse_replies(data)
+
+def _scheme(colors, style):
+    """Returns an .ansischeme dict for a snapshot."""
+    named = dict((COLORS[int(k)] if int(k) < len(COLORS) else k, v)
+                 for k, v in colors.items())
+    scheme = {'colors': named}
+    if style:
+        scheme['styles'] = {SNAPSHOT_STYLE: style}
+        scheme['default_style'] = SNAPSHOT_STYLE
+    return scheme
+
+@click.command()
+@click.option('--slots', type=click.Choice(['22', '256']), default='22',
+              show_default=True, help="palette slots to read")
+@click.option('--timeout', type=float, default=1.0, show_default=True,
+              help="seconds to wait for the terminal's replies")
+@click.argument('name', default='snapshot')
+@click.pass_obj
+def snapshot(user, slots, timeout, name):
+    """Save the terminal's current colors as a user scheme."""
+    import json
+    backend = get_backend()
+    try:
+        colors, style = query(backend, list(range(int(slots))), timeout)
+    except OSError as err:
+        raise click.ClickException('Cannot query the terminal: {}'
+                                   .format(err))
+    if not colors:
+        raise click.ClickException(
+                'The terminal did not report its colors.')
+    missing = int(slots) + len(STYLE_TARGETS) - len(colors) - len(style)
+    if missing:
+        click.echo('{} colors were not reported.'.format(missing), err=True)
+    path = os.path.join(user.data_dir, name + EXT)
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(_scheme(colors, style), f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+    # This is exactly what the terminal shows now.
+    if len(style) == len(STYLE_TARGETS) and not backend.passthrough:
+        state.write(user.data_dir, state.controlling_tty(), colors, style)
+    click.echo(path)
+
+@click.command()
+@click.option('--tty', is_flag=True,
+              help="write to /dev/tty instead of stdout")
+@click.argument('name', default='snapshot')
+@click.pass_obj
+def restore(user, tty, name):
+    """Put back colors saved by `snapshot`."""
+    from .load import _resolve_scheme, _scheme_path
+    from . import cache, inherit
+    backend = get_backend(tty='/dev/tty' if tty else None)
+    # Kept apart from `load`'s entries, which always have a style.
+    template = 'restore\0' + backend.template
+    try:
+        path = _scheme_path(user.data_dir, name)
+        output, colors, style = cache.lookup_resolved(
+                user.data_dir, name, SNAPSHOT_STYLE, template,
+                path) or (None, None, None)
+        if output is None:
+            scheme = _resolve_scheme(user.data_dir, name)
+            # fg/bg/cursor are left as they are if none were reported.
+            style = (scheme.style(SNAPSHOT_STYLE).as_dict()
+                     if SNAPSHOT_STYLE in scheme.styles else {})
+            colors = scheme.colors()
+            output = backend.payload(colors, style)
+            cache.store(user.data_dir, name, SNAPSHOT_STYLE, template, path,
+                        colors, style, output,
+                        inherit.sources(user.data_dir, name))
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    backend.emit(output)
+    if not backend.passthrough:
+        dest = state.controlling_tty() if tty else state.stdout_tty()
+        state.write(user.data_dir, dest, colors, style)
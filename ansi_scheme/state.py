@@ -0,0 +1,74 @@
+"""Per-tty record of the palette last applied to each terminal.
+
+Lets `load` send only the slots that change. Each tty gets a small JSON file
+in `<data_dir>/state`, stamped with the tty's ctime so a recycled
+/dev/pts/N (a new terminal) isn't mistaken for the old one.
+
+Only terminals written to directly have a state: tmux and screen pass the
+escapes through to an outer terminal that every pane shares, so what one
+pane's tty last sent says nothing about what it shows.
+"""
+import os
+import sys
+import json
+
+STATE_DIR = 'state'
+
+def tty_of(fd):
+    """Returns the tty path behind `fd`, or None."""
+    try:
+        return os.ttyname(fd)
+    except (OSError, ValueError, TypeError):
+        return None
+
+def stdout_tty():
+    """Returns the tty stdout is attached to, or None."""
+    try:
+        return tty_of(sys.stdout.fileno())
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def controlling_tty():
+    """Returns the path of the controlling tty, or None."""
+    for stream in (sys.stdout, sys.stdin, sys.stderr):
+        try:
+            return os.ttyname(stream.fileno())
+        except (OSError, ValueError, AttributeError):
+            continue
+    return None
+
+def _path(data_dir, tty):
+    return os.path.join(data_dir, STATE_DIR,
+                        tty.strip('/').replace('/', '-'))
+
+def _stamp(tty):
+    return os.stat(tty).st_ctime_ns
+
+def read(data_dir, tty):
+    """Returns the (colors, style) last applied to `tty`, or None."""
+    if tty is None:
+        return None
+    try:
+        with open(_path(data_dir, tty), 'rt') as f:
+            state = json.loads(f.read())
+        if state['stamp'] != _stamp(tty):
+            return None
+        return state['colors'], state['style']
+    except (IOError, OSError, ValueError, KeyError):
+        return None
+
+def write(data_dir, tty, colors, style):
+    """Records that `tty` now shows `colors` and `style`."""
+    if tty is None:
+        return
+    path = _path(data_dir, tty)
+    try:
+        data = json.dumps({'stamp': _stamp(tty), 'colors': colors,
+                           'style': style})
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wt') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except (IOError, OSError):  # state is only an optimization
+        pass
@@ -0,0 +1,257 @@
+"""Scheme repository sync.
+
+A repository is any URL (http(s):// or file://, or a plain directory) that
+serves `index.json`:
+
+    {"schemes": {"<name>": {"sha256": "<hex digest of the file>",
+                            "path": "<relative path, default name.ansischeme>"}}}
+
+Downloads are verified against the index and stored content-addressed in
+`<data_dir>/store`, keyed on the hash of the scheme's canonical JSON so
+identical palettes are kept once however they're formatted. User schemes
+are copies of store objects, never hard links, so editing one in place
+can't change another scheme or the store.
+`<data_dir>/sync/<repo>.json` remembers the index ETag and the digest of
+every synced scheme so only changed schemes are fetched.
+"""
+import os
+import json
+import zlib
+import hashlib
+import threading
+
+import click
+
+from .constants import *
+
+STORE_DIR = 'store'
+SYNC_DIR = 'sync'
+INDEX = 'index.json'
+
+def _repo_url(repository):
+    if '://' not in repository:
+        repository = 'file://' + os.path.abspath(repository)
+    return repository.rstrip('/') + '/'
+
+class _Fetcher(object):
+    """Fetches URLs, keeping one persistent HTTP connection per thread and
+    host so a bounded thread pool is also a bounded connection pool."""
+
+    def __init__(self, timeout=30):
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def _connection(self, scheme, host):
+        import http.client
+        connections = getattr(self.local, 'connections', None)
+        if connections is None:
+            connections = self.local.connections = {}
+        key = (scheme, host)
+        if key not in connections:
+            cls = (http.client.HTTPSConnection if scheme == 'https' else
+                   http.client.HTTPConnection)
+            connections[key] = cls(host, timeout=self.timeout)
+        return connections[key]
+
+    def get(self, url, etag=None):
+        """Returns (body or None if not modified, etag)."""
+        import http.client
+        from urllib.parse import urlsplit, unquote
+        parts = urlsplit(url)
+        if parts.scheme == 'file':
+            path = unquote(parts.path)
+            st = os.stat(path)
+            # Local mirrors get a cheap ETag from the file's stat.
+            tag = '{}-{}'.format(st.st_mtime_ns, st.st_size)
+            if tag == etag:
+                return None, etag
+            with open(path, 'rb') as f:
+                return f.read(), tag
+        if parts.scheme not in ('http', 'https'):
+            raise ValueError('Unsupported repository URL {}'.format(url))
+        headers = {'If-None-Match': etag} if etag else {}
+        target = parts.path + ('?' + parts.query if parts.query else '')
+        for attempt in (0, 1):  # retry once on a stale keep-alive connection
+            conn = self._connection(parts.scheme, parts.netloc)
+            try:
+                conn.request('GET', target, headers=headers)
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except (OSError, http.client.HTTPException) as err:
+                conn.close()
+                if attempt:
+                    raise ValueError('Fetching {} failed: {}'.format(url, err))
+        if response.status == 304:
+            return None, etag
+        if response.status != 200:
+            raise ValueError('Fetching {} failed: HTTP {}'
+                             .format(url, response.status))
+        return body, response.getheader('ETag')
+
+def _canonical(data):
+    """Returns (canonical JSON bytes, their sha256). Raises ValueError."""
+    scheme = json.loads(data.decode('utf-8'))
+    if not isinstance(scheme, dict) or 'colors' not in scheme:
+        raise ValueError('not a scheme')
+    canonical = json.dumps(scheme, indent=2, sort_keys=True).encode('utf-8')
+    return canonical, hashlib.sha256(canonical).hexdigest()
+
+def _store_path(data_dir, digest):
+    return os.path.join(data_dir, STORE_DIR, digest[:2], digest)
+
+def _store(data_dir, canonical, digest):
+    """Adds an object to the store if it isn't there yet."""
+    path = _store_path(data_dir, digest)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(canonical)
+        os.replace(tmp, path)
+    return path
+
+def _valid_name(name):
+    """Whether an index entry's name is safe to use as a file name."""
+    return (bool(name) and os.sep not in name and '/' not in name and
+            '..' not in name and name == os.path.basename(name))
+
+def _install(data_dir, name, object_path):
+    """Copies a store object into place as the user scheme `name`.
+
+    Raises ValueError if `name` isn't a plain file name."""
+    import shutil
+    if not _valid_name(name):
+        raise ValueError('{!r}: invalid scheme name'.format(name))
+    target = os.path.join(data_dir, name + EXT)
+    tmp = '{}.{}.tmp'.format(target, os.getpid())
+    shutil.copyfile(object_path, tmp)
+    os.replace(tmp, target)
+
+class Repository(object):
+    def __init__(self, data_dir, repository, jobs=8):
+        self.data_dir = data_dir
+        self.url = _repo_url(repository)
+        self.jobs = jobs
+        self.fetcher = _Fetcher()
+        key = '{:08x}'.format(zlib.crc32(self.url.encode('utf-8')))
+        self.state_path = os.path.join(data_dir, SYNC_DIR, key + '.json')
+
+    def _load_state(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {'url': self.url, 'etag': None, 'index': None,
+                    'schemes': {}}
+
+    def _save_state(self, state):
+        directory = os.path.dirname(self.state_path)
+        os.makedirs(directory, exist_ok=True)
+        tmp = '{}.{}.tmp'.format(self.state_path, os.getpid())
+        with open(tmp, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def _download(self, name, entry):
+        """Returns (name, remote digest, store digest); raises ValueError."""
+        url = self.url + entry.get('path', name + EXT)
+        data, _ = self.fetcher.get(url)
+        if hashlib.sha256(data).hexdigest() != entry['sha256']:
+            raise ValueError('{}: checksum mismatch'.format(name))
+        canonical, digest = _canonical(data)
+        _store(self.data_dir, canonical, digest)
+        return name, entry['sha256'], digest
+
+    def sync(self, names=None, force=False, report=None):
+        """Fetches new and changed schemes; returns the names installed.
+
+        `names` restricts the sync to those schemes. Local schemes that
+        weren't installed by a sync are left alone unless `force`."""
+        from concurrent.futures import ThreadPoolExecutor
+        report = report or (lambda message: None)
+        state = self._load_state()
+        body, etag = self.fetcher.get(self.url + INDEX, state['etag'])
+        if body is not None:
+            state['index'] = json.loads(body.decode('utf-8'))['schemes']
+            state['etag'] = etag
+        index = state['index'] or {}
+        synced = state['schemes']
+
+        wanted = {}
+        for name, entry in index.items():
+            if names is not None and name not in names:
+                continue
+            if not _valid_name(name):
+                report('{!r}: invalid scheme name, skipping'.format(name))
+                continue
+            local = os.path.join(self.data_dir, name + EXT)
+            if name in synced:
+                remote_digest, digest = synced[name]
+                if (remote_digest == entry['sha256'] and os.path.exists(local)
+                        and os.path.exists(_store_path(self.data_dir, digest))):
+                    continue  # unchanged
+            elif os.path.exists(local) and not force:
+                report('{}: exists locally, skipping (use --force)'
+                       .format(name))
+                continue
+            wanted[name] = entry
+        for name in set(names or ()) - set(index):
+            report('{}: not in the repository'.format(name))
+
+        # Schemes with the same file only need downloading once.
+        by_digest = {}
+        for name, entry in sorted(wanted.items()):
+            by_digest.setdefault(entry['sha256'], []).append(name)
+
+        installed = []
+        with ThreadPoolExecutor(max_workers=self.jobs) as pool:
+            futures = [pool.submit(self._download, aliases[0],
+                                   wanted[aliases[0]])
+                       for aliases in by_digest.values()]
+            for future in futures:
+                try:
+                    name, remote_digest, digest = future.result()
+                except (ValueError, OSError) as err:
+                    report(str(err))
+                    continue
+                object_path = _store_path(self.data_dir, digest)
+                for alias in by_digest[remote_digest]:
+                    _install(self.data_dir, alias, object_path)
+                    synced[alias] = [remote_digest, digest]
+                    installed.append(alias)
+        self._save_state(state)
+        return sorted(installed)
+
+def _repository(user, repository):
+    repository = repository or user.settings.get('repository')
+    if not repository:
+        raise click.ClickException(
+                'No scheme repository configured; pass one to '
+                '`ansi-scheme sync`.')
+    return repository
+
+@click.command()
+@click.option('-j', '--jobs', type=int, default=8, show_default=True,
+              help="parallel downloads")
+@click.option('--force', is_flag=True,
+              help="replace local schemes of the same name")
+@click.argument('repository', required=False)
+@click.argument('schemes', nargs=-1)
+@click.pass_obj
+def sync(user, jobs, force, repository, schemes):
+    """Fetch new and changed schemes from a repository.
+
+    REPOSITORY is remembered as the default for later syncs."""
+    repository = _repository(user, repository)
+    repo = Repository(user.data_dir, repository, jobs)
+    report = lambda message: click.echo(message, err=True)
+    try:
+        installed = repo.sync(set(schemes) or None, force, report)
+    except (ValueError, OSError, KeyError) as err:
+        raise click.ClickException(str(err))
+    for name in installed:
+        click.echo(name)
+    if user.settings.get('repository') != repository:
+        user.settings['repository'] = repository
+        user.save_settings()
@@ -0,0 +1,153 @@
+"""Terminal backends.
+
+A backend knows how to wrap OSC color sequences for one kind of terminal
+(plain xterm-compatible, GNU screen, tmux passthrough) and where to write
+them. Everything a `load` emits is assembled into one bytes buffer and
+written with a single `os.write`.
+"""
+import os
+import sys
+
+STYLE_TARGETS = {
+    'foreground': 10,
+    'background': 11,
+    'cursor': 12
+}
+
+class Backend(object):
+    """Base backend; subclasses set the name and templates.
+
+    Output goes to stdout. `passthrough` backends talk through a
+    multiplexer to an outer terminal that other ttys share."""
+    name = None
+    passthrough = False
+    palette_template = None
+    style_template = None
+
+    @property
+    def template(self):
+        """Identifies the escape output this backend produces."""
+        return self.palette_template + self.style_template
+
+    def palette(self, colors):
+        """Returns the escapes setting color index i to each `colors[i]`."""
+        tmp = self.palette_template
+        return ''.join([tmp.format(i, c) for i, c in colors.items()])
+
+    def style(self, style):
+        """Returns the escapes setting fg/bg/cursor."""
+        tmp = self.style_template
+        return ''.join([tmp.format(STYLE_TARGETS[k], v)
+                        for k, v in style.items()])
+
+    def payload(self, colors, style):
+        """Returns palette and style escapes as one bytes buffer."""
+        return (self.palette(colors) + self.style(style)).encode('utf-8')
+
+    def query(self, slots, targets=('foreground', 'background', 'cursor')):
+        """Returns escapes asking for the colors of palette `slots` and of
+        the style `targets`, as one bytes buffer."""
+        palette = self.palette_template.replace('rgb:{}', '?')
+        style = self.style_template.replace('rgb:{}', '?')
+        return (''.join([palette.format(i) for i in slots]) +
+                ''.join([style.format(STYLE_TARGETS[k]) for k in targets])
+                ).encode('utf-8')
+
+    def _fileno(self):
+        sys.stdout.flush()
+        return sys.stdout.fileno()
+
+    def emit(self, payload):
+        """Writes `payload` in a single write unless the fd takes less."""
+        try:
+            fd = self._fileno()
+        except (AttributeError, ValueError, IOError):
+            # stdout isn't a real file (e.g. captured); write through Python.
+            out = getattr(sys.stdout, 'buffer', None)
+            if out is None:
+                sys.stdout.write(payload.decode('utf-8'))
+            else:
+                out.write(payload)
+            sys.stdout.flush()
+            return
+        view = memoryview(payload)
+        while view:
+            view = view[os.write(fd, view):]
+
+class XtermBackend(Backend):
+    """Plain xterm OSC sequences."""
+    name = 'plain'
+    palette_template = '\033]4;{};rgb:{}\033\\'
+    style_template = '\033]{};rgb:{}\033\\'
+
+class ScreenBackend(Backend):
+    """Wraps each sequence in a DCS string for GNU screen."""
+    name = 'screen'
+    passthrough = True
+    palette_template = '\033P\033]4;{};rgb:{}\033\\'
+    style_template = '\033P\033]{};rgb:{}\033\\'
+
+class TmuxBackend(Backend):
+    """Wraps each sequence in tmux's DCS passthrough."""
+    name = 'tmux'
+    passthrough = True
+    palette_template = '\033Ptmux;\033\033]4;{};rgb:{}\033\033\\\033\\'
+    style_template = '\033Ptmux;\033\033]{};rgb:{}\033\033\\\033\\'
+
+class TtyBackend(Backend):
+    """Writes another backend's sequences straight to a tty.
+
+    Useful when stdout is redirected (e.g. from a script or a pipe)."""
+
+    def __init__(self, wrapped, tty='/dev/tty'):
+        self.wrapped = wrapped
+        self.tty = tty
+        self.name = wrapped.name
+        self.passthrough = wrapped.passthrough
+        self.palette_template = wrapped.palette_template
+        self.style_template = wrapped.style_template
+
+    def emit(self, payload):
+        fd = os.open(self.tty, os.O_WRONLY | os.O_NOCTTY)
+        try:
+            view = memoryview(payload)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+
+BACKENDS = {
+    'plain': XtermBackend,
+    'screen': ScreenBackend,
+    'tmux': TmuxBackend
+}
+
+def detect_kind(environ=None):
+    """Returns which kind of backend this environment needs."""
+    environ = os.environ if environ is None else environ
+    tmux = environ.get('TMUX')
+    term = (environ.get('TERM') or environ.get('TERMINAL'))
+    if tmux and len(tmux) > 0:
+        return 'tmux'
+    elif term and term.startswith('screen'):
+        return 'screen'
+    else:
+        return 'plain'
+
+def get_backend(kind=None, tty=None):
+    """Returns a backend for `kind` (detected if None).
+
+    If `tty` is given, output goes directly to that device."""
+    backend = BACKENDS[kind or detect_kind()]()
+    if tty:
+        backend = TtyBackend(backend, tty)
+    return backend
+
+def diff(old_colors, old_style, colors, style):
+    """Returns the (colors, style) entries that differ from what's applied.
+
+    Pass None for the old values if nothing is known to be applied."""
+    old_colors = old_colors or {}
+    old_style = old_style or {}
+    return (dict((i, c) for i, c in colors.items() if old_colors.get(i) != c),
+            dict((k, v) for k, v in style.items() if old_style.get(k) != v))
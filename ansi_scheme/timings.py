@@ -0,0 +1,81 @@
+"""Per-stage timings for finding out where a slow command spends its time.
+
+Enabled with `ansi-scheme --timings` or ANSI_SCHEME_PROFILE. Stages are
+timed with the monotonic clock and reported on stderr, or appended as one
+JSON line to a log file, once the command finishes; the escape output is
+left alone. While disabled, `stage` hands back a shared no-op.
+"""
+import time
+
+# Set when cli.py starts importing, so 'import' covers click and the command.
+IMPORT_START = time.monotonic()
+
+_stages = None  # [(name, seconds)] while recording
+
+class _Stage(object):
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.monotonic()
+
+    def __exit__(self, *exc):
+        record(self.name, time.monotonic() - self.start)
+
+class _Off(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+_OFF = _Off()
+
+def enable():
+    """Starts recording; the time spent importing so far is the first stage."""
+    global _stages
+    _stages = [('import', time.monotonic() - IMPORT_START)]
+
+def enabled():
+    return _stages is not None
+
+def record(name, seconds):
+    if _stages is not None:
+        _stages.append((name, seconds))
+
+def stage(name):
+    """Returns a context manager timing `name` (a no-op when disabled)."""
+    return _OFF if _stages is None else _Stage(name)
+
+def totals():
+    """Returns [(stage, ms)] in first-seen order, summing repeats."""
+    order, sums = [], {}
+    for name, seconds in _stages or ():
+        if name not in sums:
+            order.append(name)
+            sums[name] = 0.0
+        sums[name] += seconds * 1000
+    return [(name, sums[name]) for name in order]
+
+def report(target):
+    """Writes the timings to stderr ('-') or appends them to a JSON log."""
+    import sys
+    stages = totals()
+    total = (time.monotonic() - IMPORT_START) * 1000
+    if target == '-':
+        lines = ['ansi-scheme timings (ms):']
+        lines += ['  {:<20} {:8.2f}'.format(name, ms) for name, ms in stages]
+        lines.append('  {:<20} {:8.2f}'.format('total', total))
+        sys.stderr.write('\n'.join(lines) + '\n')
+        return
+    import json
+    entry = {'argv': sys.argv[1:], 'time': time.time(),
+             'stages': dict(stages), 'total': total}
+    try:
+        with open(target, 'a') as f:
+            f.write(json.dumps(entry, sort_keys=True) + '\n')
+    except (IOError, OSError) as err:
+        sys.stderr.write('Cannot write timings to {}: {}\n'
+                         .format(target, err))
@@ -0,0 +1,143 @@
+"""Recoloring every pane of a tmux server from one control-mode connection.
+
+`ansi-scheme tmux` attaches to the server once as a control client
+(`tmux -C`, without pane output or a size of its own) and sends all of its
+commands in a single write: `list-panes -a` for every pane's tty and, with
+--status, the option lines of `render tmux`. Replies come back in order as
+%begin ... %end (or %error) blocks. The cached tmux escape output is then
+written to each pane's tty whole: passthrough lands on the terminal the
+pane's client runs in, which its other panes share, so nothing about it can
+be known per pane.
+
+Needs tmux 3.2 or later.
+"""
+import click
+
+from .constants import *
+
+_LIST_PANES = "list-panes -a -F '#{pane_id} #{pane_tty}'"
+_ATTACH = ['-C', 'attach-session', '-f', 'no-output,ignore-size']
+_WRITERS = 8
+
+def _replies(output):
+    """Returns [(ok, lines)] for the command blocks in control-mode output,
+    in order, and the error of the attach itself (or None).
+
+    Lines inside a block may start with '%' (pane ids do), so a block only
+    ends at the %end/%error carrying its own time and number."""
+    replies, error = [], None
+    block = lines = None
+    for line in output.decode('utf-8', 'replace').splitlines():
+        if block is None:
+            if line.startswith('%begin '):
+                block, lines = line.split(' ', 1)[1], []
+            continue
+        end, _, rest = line.partition(' ')
+        if end in ('%end', '%error') and rest == block:
+            if block.endswith(' 1'):  # sent by this client
+                replies.append((end == '%end', lines))
+            elif end == '%error':  # attach-session failed
+                error = ' '.join(lines)
+            block = None
+        else:
+            lines.append(line)
+    return replies, error
+
+class Control(object):
+    """A control-mode connection to the tmux server at `-L socket_name` or
+    `-S socket_path` (the default server if neither)."""
+
+    def __init__(self, socket_name=None, socket_path=None):
+        self.args = ['tmux']
+        if socket_name:
+            self.args += ['-L', socket_name]
+        if socket_path:
+            self.args += ['-S', socket_path]
+        self.args += _ATTACH
+
+    def run(self, commands, timeout=5.0):
+        """Sends `commands` in one batch; returns each one's output lines.
+
+        Raises ValueError if tmux can't be reached or a command fails."""
+        import subprocess
+        try:
+            proc = subprocess.Popen(self.args, stdin=subprocess.PIPE,
+                                    stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+        except OSError as err:
+            raise ValueError('Cannot run tmux: {}'.format(err))
+        batch = ''.join(command + '\n' for command in commands)
+        try:
+            out, err = proc.communicate(batch.encode('utf-8'), timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise ValueError('tmux did not answer in {} s.'.format(timeout))
+        replies, error = _replies(out)
+        if len(replies) != len(commands):
+            raise ValueError('tmux: {}'.format(
+                    error or err.decode('utf-8', 'replace').strip() or
+                    'no reply'))
+        for command, (ok, lines) in zip(commands, replies):
+            if not ok:
+                raise ValueError('tmux: {}: {}'.format(
+                        command.split()[0], ' '.join(lines)))
+        return [lines for _, lines in replies]
+
+def pane_ttys(lines):
+    """Returns the distinct pane ttys in `list-panes` output, in order."""
+    ttys = []
+    for line in lines:
+        _, _, tty = line.partition(' ')
+        if tty and tty not in ttys:
+            ttys.append(tty)
+    return ttys
+
+def _conf_commands(conf):
+    """Returns the commands in a rendered tmux.conf."""
+    return [line for line in conf.decode('utf-8').splitlines()
+            if line.strip() and not line.lstrip().startswith('#')]
+
+def push(ttys, output):
+    """Writes the escape output to every pane tty at once.
+
+    Returns the number of panes written to."""
+    from concurrent.futures import ThreadPoolExecutor
+    from .daemon import _write_tty
+    with ThreadPoolExecutor(min(_WRITERS, len(ttys) or 1)) as pool:
+        return sum(pool.map(lambda tty: _write_tty(tty, output), ttys))
+
+@click.command('tmux')
+@click.option('-L', 'socket_name', metavar='NAME',
+              help="tmux server socket name")
+@click.option('-S', 'socket_path', type=click.Path(), metavar='PATH',
+              help="tmux server socket path")
+@click.option('--status', is_flag=True,
+              help="also color tmux's status line, borders and messages")
+@click.argument('scheme', required=False)
+@click.argument('style', required=False)
+@click.pass_obj
+def tmux(user, socket_name, socket_path, status, scheme, style):
+    """Load a scheme in every pane of a tmux server."""
+    from .compile import _output
+    scheme_name = scheme or user.settings['scheme_name']
+    style_name = style or user.settings['style_name'] or DEFAULT_STYLE
+    try:
+        output = _output(user.data_dir, scheme_name, style_name, 'tmux')
+        commands = [_LIST_PANES]
+        if status:
+            from .render import render
+            conf, _ = render(user.data_dir, 'tmux', scheme_name, style_name)
+            commands.extend(_conf_commands(conf))
+        replies = Control(socket_name, socket_path).run(commands)
+    except ValueError as err:
+        raise click.ClickException(str(err))
+    ttys = pane_ttys(replies[0])
+    count = push(ttys, output)
+    click.echo('Loaded in {} of {} panes.'.format(count, len(ttys)), err=True)
+
+    if (user.settings.get('scheme_name') != scheme_name or
+            user.settings.get('style_name') != style_name):
+        user.settings['scheme_name'] = scheme_name
+        user.settings['style_name'] = style_name
+        user.save_settings()
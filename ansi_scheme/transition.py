@@ -0,0 +1,89 @@
+"""Cross-fades between palettes.
+
+Every slot that changes is interpolated in OKLab from what the terminal shows
+now to the target. All frames are built up front; each one holds every
+changing slot (not just what moved since the previous frame), so frames can
+be dropped when the terminal falls behind without leaving stale colors.
+"""
+import re
+import time
+
+import click
+
+FPS = 60
+
+class Duration(click.ParamType):
+    """A duration like 300ms, 1.5s or 300 (milliseconds); in seconds."""
+    name = 'duration'
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, float):
+            return value
+        match = re.match(r'^\s*(\d+(?:\.\d*)?)\s*(ms|s)?\s*$', value)
+        if not match:
+            self.fail('{} is not a duration like 300ms or 1.5s.'
+                      .format(value), param, ctx)
+        amount = float(match.group(1))
+        return amount if match.group(2) == 's' else amount / 1000.0
+
+def _ease(t):
+    return t * t * (3 - 2 * t)
+
+def frames(backend, start, target, duration, fps=FPS):
+    """Returns the payloads of the in-between frames from `start` to
+    `target`, both (colors, style); the target itself isn't included."""
+    from .color import parse_rgb, format_rgb, to_oklab, from_oklab
+    count = int(round(duration * fps))
+    (old_colors, old_style), (colors, style) = start, target
+    # Only slots with a known starting value can fade.
+    keys = [('c', i) for i, c in colors.items()
+            if old_colors.get(i) not in (None, c)]
+    keys += [('s', k) for k, v in style.items()
+             if old_style.get(k) not in (None, v)]
+    if count < 2 or not keys:
+        return []
+    old = dict([(('c', i), c) for i, c in old_colors.items()] +
+               [(('s', k), v) for k, v in old_style.items()])
+    new = dict([(('c', i), c) for i, c in colors.items()] +
+               [(('s', k), v) for k, v in style.items()])
+    p = to_oklab([parse_rgb(old[key]) for key in keys])
+    q = to_oklab([parse_rgb(new[key]) for key in keys])
+
+    points = []
+    for n in range(1, count):
+        t = _ease(n / float(count))
+        points.extend(tuple(a + (b - a) * t for a, b in zip(x, y))
+                      for x, y in zip(p, q))
+    rgb = from_oklab(points)
+    payloads = []
+    for n in range(count - 1):
+        frame = rgb[n * len(keys):(n + 1) * len(keys)]
+        frame_colors, frame_style = {}, {}
+        for (kind, key), value in zip(keys, frame):
+            (frame_colors if kind == 'c' else frame_style)[key] = \
+                format_rgb(value)
+        payloads.append(backend.payload(frame_colors, frame_style))
+    return payloads
+
+def play(backend, payloads, duration):
+    """Writes `payloads` evenly over `duration` seconds, one write each.
+
+    A frame whose successor is already due is skipped."""
+    if not payloads:
+        return
+    interval = duration / (len(payloads) + 1)
+    begin = time.monotonic()
+    n = 0
+    while n < len(payloads):
+        delay = begin + (n + 1) * interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        # Catch up to the latest frame that is due.
+        due = int((time.monotonic() - begin) / interval) - 1
+        n = max(n, min(due, len(payloads) - 1))
+        backend.emit(payloads[n])
+        n += 1
+    # The caller's final write lands on the last interval boundary.
+    delay = begin + duration - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
@@ -12,10 +12,64 @@ def _mkdir_p(path):
         else:
             raise
 
+def _read_settings(settings_file):
+    """Returns the settings dict, or None if missing or unreadable.
+
+    The file is only ever replaced by a rename, so readers never see a
+    partial write and don't need the lock."""
+    try:
+        with open(settings_file, 'rt') as f:
+            settings = json.loads(f.read())
+    except (IOError, OSError, ValueError):
+        return None
+    return settings if isinstance(settings, dict) else None
+
+class _Lock(object):
+    """An exclusive fcntl lock on `<path>.lock` (a no-op without fcntl)."""
+
+    def __init__(self, path):
+        self.path = path + '.lock'
+        self.fd = None
+
+    def __enter__(self):
+        try:
+            import fcntl
+        except ImportError:
+            return self
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.fd is not None:
+            os.close(self.fd)  # releases the lock
+            self.fd = None
+
 class User(object):
     def save_settings(self):
-        with open(self.settings_file, 'w') as f:
-            json.dump(self.settings, f)
+        """Writes the settings changed since they were read.
+
+        Other processes may have saved in the meantime; their changes to
+        other keys are kept. Does nothing if the file is already current."""
+        changed = dict((k, v) for k, v in self.settings.items()
+                       if k not in self._saved or self._saved[k] != v)
+        if not changed:
+            return
+        with _Lock(self.settings_file):
+            current = _read_settings(self.settings_file) or \
+                dict(self.default_settings)
+            if all(current.get(k) == v for k, v in changed.items()):
+                self._saved = dict(current)
+                return
+            current.update(changed)
+            tmp = '{}.{}.tmp'.format(self.settings_file, os.getpid())
+            with open(tmp, 'w') as f:
+                json.dump(current, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.settings_file)
+        self._saved = dict(current)
+        self.settings.update(current)
 
     def __init__(self):
         xdg = os.environ['XDG_DATA_HOME']
@@ -23,20 +77,19 @@ class User(object):
                     os.path.abspath('~/.ansi-scheme'))
         _mkdir_p(data_dir)
 
-        # Make sure the user settings file exists.
         settings_file = os.path.join(data_dir, 'settings.json')
-        default_settings = {
+        self.default_settings = {
                 'scheme_name': 'default',
                 'style_name': None
         }
 
-        # Create the file if it doesn't exist yet.
-        with open(settings_file, 'a+t') as f:
-            f.seek(0)
-            try:
-                settings = json.loads(f.read())
-            except ValueError:  # loads failure; set defaults
-                settings = default_settings
+        # Lock-free read; a missing file is created on the first save.
+        settings = _read_settings(settings_file)
+        if settings is None:  # loads failure; set defaults
+            settings = dict(self.default_settings)
+            self._saved = {}
+        else:
+            self._saved = dict(settings)
 
         self.settings = settings
         self.data_dir = data_dir
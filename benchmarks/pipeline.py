@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""Benchmarks for the load pipeline over synthetic scheme libraries.
+
+For each library size a throwaway XDG_DATA_HOME is filled with that many
+random user schemes, then this measures:
+
+  * `load` end to end in a fresh interpreter, cold (no compiled cache) and
+    warm, with the peak RSS of the process;
+  * each stage of a load in-process (User(), _scheme_path,
+    _resolve_colorscheme, _resolve_colors, _resolve_style, payload, emit,
+    save_settings) plus _parse_rgb_hex and _resolve_style_value per call;
+  * `ls` and `ls -q` end to end, and listing in-process.
+
+Times are the median of --runs repetitions, in milliseconds.
+
+    python benchmarks/pipeline.py [--sizes 10,1000,50000] [--runs 5]
+                                  [--json report.json] [--compare old.json]
+"""
+from __future__ import print_function
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+COLOR_NAMES = ['Black', 'Red', 'Green', 'Yellow', 'Blue', 'Magenta', 'Cyan',
+               'White', 'BrightBlack', 'BrightRed', 'BrightGreen',
+               'BrightYellow', 'BrightBlue', 'BrightMagenta', 'BrightCyan',
+               'BrightWhite']
+# Runs one CLI command and reports the child's peak RSS on stderr.
+CHILD = '''import resource, sys
+try:
+    from ansi_scheme.cli import cli
+    cli({!r})
+finally:
+    sys.stderr.write('\\nmaxrss {{}}\\n'.format(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+'''
+
+
+def _hex(rng):
+    return '{:06x}'.format(rng.getrandbits(24))
+
+
+def make_library(data_dir, size, seed=0):
+    """Writes `size` random schemes; returns their names."""
+    rng = random.Random(seed)
+    names = []
+    for i in range(size):
+        name = 'bench-{:06d}'.format(i)
+        colors = dict((c, _hex(rng)) for c in COLOR_NAMES)
+        for slot in range(16, 22):
+            colors[str(slot)] = _hex(rng)
+        scheme = {'colors': colors,
+                  'styles': {'dark': {'foreground': 'White',
+                                      'background': 'Black',
+                                      'cursor': '19'}}}
+        with open(os.path.join(data_dir, name + '.ansischeme'), 'w') as f:
+            json.dump(scheme, f)
+        names.append(name)
+    return names
+
+
+def _median(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2]
+
+
+def _run_cli(args, env):
+    """Returns (wall ms, peak RSS KiB) of one CLI run in a new process."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-c', CHILD.format(args)],
+                          env=env, cwd=ROOT, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = (time.perf_counter() - start) * 1000
+    if proc.returncode:
+        raise RuntimeError('{} failed:\n{}'.format(args, proc.stderr))
+    rss = int(proc.stderr.rsplit('maxrss ', 1)[1])
+    return elapsed, rss
+
+
+def _clear_cache(data_dir):
+    import shutil
+    for name in ('cache', 'state'):
+        shutil.rmtree(os.path.join(data_dir, name), ignore_errors=True)
+
+
+def bench_processes(data_dir, env, scheme, runs):
+    results = {}
+    load = ['load', '--no-broadcast', scheme, 'dark']
+    cold, warm, rss = [], [], []
+    for _ in range(runs):
+        _clear_cache(data_dir)
+        ms, peak = _run_cli(load, env)
+        cold.append(ms)
+        rss.append(peak)
+        ms, peak = _run_cli(load, env)
+        warm.append(ms)
+        rss.append(peak)
+    results['load_cold_ms'] = _median(cold)
+    results['load_warm_ms'] = _median(warm)
+    results['load_peak_rss_kib'] = max(rss)
+    for label, args in (('ls', ['ls', '--user']), ('ls_q', ['ls', '-q', '--user'])):
+        samples = [_run_cli(args, env) for _ in range(runs)]
+        results[label + '_ms'] = _median([ms for ms, _ in samples])
+        results[label + '_peak_rss_kib'] = max(peak for _, peak in samples)
+    return results
+
+
+def _time(fn, runs, number=1):
+    """Returns the median ms per call of `fn` over `runs` batches."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) * 1000 / number)
+    return _median(samples)
+
+
+def bench_stages(data_dir, scheme_name, runs):
+    """Times each load stage in-process (imports already done)."""
+    import tracemalloc
+    from ansi_scheme import cache, inherit
+    from ansi_scheme.user import User
+    from ansi_scheme.load import (_scheme_path, _resolve_colorscheme,
+                                  _resolve_colors, _resolve_style,
+                                  _resolve_style_value, _parse_rgb_hex,
+                                  set_colors, set_style)
+    from ansi_scheme.ls import _iter_schemes
+    from ansi_scheme.terminal import get_backend
+
+    user = User()
+    backend = get_backend('plain')
+    scheme = _resolve_colorscheme(data_dir, scheme_name, 'dark')
+    colors = _resolve_colors(scheme)
+    style = _resolve_style(scheme, colors, 'dark')
+    path = _scheme_path(data_dir, scheme_name)
+    output = backend.payload(colors, style)
+    cache.store(data_dir, scheme_name, 'dark', backend.template, path,
+                colors, style, output)
+
+    def resolve_colorscheme():
+        # Resolutions are memoized per process; time a real one.
+        inherit._memo.clear()
+        return _resolve_colorscheme(data_dir, scheme_name, 'dark')
+
+    names = [scheme_name, 'default']
+
+    def save_settings():
+        # Unchanged settings aren't written; switch schemes every call.
+        names.reverse()
+        user.settings['scheme_name'] = names[0]
+        user.save_settings()
+
+    results = {}
+    stages = [
+        ('user_init', User, 20),
+        ('scheme_path', lambda: _scheme_path(data_dir, scheme_name), 100),
+        ('resolve_colorscheme', resolve_colorscheme, 100),
+        ('resolve_colors', lambda: _resolve_colors(scheme), 100),
+        ('resolve_style', lambda: _resolve_style(scheme, colors, 'dark'), 100),
+        ('payload', lambda: backend.payload(colors, style), 100),
+        ('cache_lookup',
+         lambda: cache.lookup(data_dir, scheme_name, 'dark',
+                              backend.template, path), 100),
+        ('parse_rgb_hex', lambda: _parse_rgb_hex('#a1b2c3'), 1000),
+        ('resolve_style_value',
+         lambda: _resolve_style_value(colors, 'White'), 1000),
+        ('save_settings', save_settings, 20),
+    ]
+    for name, fn, number in stages:
+        results[name + '_ms'] = _time(fn, runs, number)
+
+    # Emission goes to stdout; point it at /dev/null meanwhile.
+    sys.stdout.flush()
+    saved = os.dup(1)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    try:
+        results['set_colors_ms'] = _time(
+            lambda: set_colors(colors, backend), runs, 100)
+        results['set_style_ms'] = _time(
+            lambda: set_style(colors, style, backend), runs, 100)
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
+
+    results['ls_iter_ms'] = _time(
+        lambda: sum(1 for _ in _iter_schemes(user, 'user')), runs)
+    tracemalloc.start()
+    sum(1 for _ in _iter_schemes(user, 'user'))
+    _resolve_colors(_resolve_colorscheme(data_dir, scheme_name, 'dark'))
+    results['ls_iter_peak_alloc_kib'] = tracemalloc.get_traced_memory()[1] // 1024
+    tracemalloc.stop()
+    return results
+
+
+def bench_size(size, runs):
+    with tempfile.TemporaryDirectory() as xdg:
+        env = dict(os.environ, XDG_DATA_HOME=xdg, PYTHONPATH=ROOT)
+        os.environ['XDG_DATA_HOME'] = xdg
+        data_dir = os.path.join(xdg, 'ansi-scheme')
+        os.makedirs(data_dir)
+        start = time.perf_counter()
+        names = make_library(data_dir, size)
+        print('  generated {} schemes in {:.1f} s'
+              .format(size, time.perf_counter() - start), file=sys.stderr)
+        scheme = names[len(names) // 2]
+        results = bench_processes(data_dir, env, scheme, runs)
+        results.update(bench_stages(data_dir, scheme, runs))
+        return results
+
+
+def compare(report, old):
+    """Prints each metric next to the same metric of an older report."""
+    for size, results in sorted(report['sizes'].items(), key=lambda i: int(i[0])):
+        before = old.get('sizes', {}).get(size)
+        if not before:
+            continue
+        print('{} schemes:'.format(size))
+        for metric, value in sorted(results.items()):
+            if metric in before and before[metric]:
+                print('  {:<28} {:>10.3f} {:>10.3f} {:>+7.1f}%'.format(
+                    metric, before[metric], value,
+                    (value - before[metric]) * 100.0 / before[metric]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes', default='10,1000,50000',
+                        help='comma-separated library sizes')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', metavar='PATH',
+                        help="write the report here ('-' for stdout)")
+    parser.add_argument('--compare', metavar='PATH',
+                        help='show changes against an earlier report')
+    args = parser.parse_args()
+
+    report = {'python': platform.python_version(),
+              'platform': platform.platform(),
+              'runs': args.runs,
+              'sizes': {}}
+    for size in [int(s) for s in args.sizes.split(',')]:
+        print('{} schemes'.format(size), file=sys.stderr)
+        results = bench_size(size, args.runs)
+        report['sizes'][str(size)] = results
+        if not args.json == '-':
+            for metric, value in sorted(results.items()):
+                print('  {:<28} {:>10.3f}'.format(metric, value))
+
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""Timing of concurrent writers of settings.json.
+
+Starts many `ansi-scheme load` processes at once (as when dozens of tmux
+panes open together), alongside processes that save an unrelated setting,
+in a throwaway XDG_DATA_HOME, and reports how long each round takes. That
+no update is lost is checked by tests/test_settings.py.
+
+    python benchmarks/settings_stress.py [--processes 40] [--rounds 10]
+"""
+from __future__ import print_function
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCHEMES = ['default', 'atelier-heath', 'atelier-savanna']
+STYLES = ['dark', 'light']
+LOAD = 'from ansi_scheme.cli import cli; cli({!r})'
+# Saves only the 'repository' setting, like `sync` does.
+OTHER = '''from ansi_scheme.user import User
+user = User()
+user.settings['repository'] = {!r}
+user.save_settings()
+'''
+
+
+def _round(env, processes, rng):
+    """Runs one round; returns the first failing process's stderr, if any."""
+    procs = []
+    for i in range(processes):
+        if i % 8 == 7:
+            code = OTHER.format('file:///tmp/repo-{}'.format(i))
+        else:
+            code = LOAD.format(['load', '--no-broadcast',
+                                rng.choice(SCHEMES), rng.choice(STYLES)])
+        procs.append(subprocess.Popen([sys.executable, '-c', code], env=env,
+                                      cwd=ROOT, stdout=subprocess.DEVNULL,
+                                      stderr=subprocess.PIPE))
+    errors = [p.communicate()[1] for p in procs if p.wait()]
+    return errors[0].decode('utf-8', 'replace') if errors else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--processes', type=int, default=40)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as xdg:
+        env = dict(os.environ, XDG_DATA_HOME=xdg, PYTHONPATH=ROOT)
+        for n in range(args.rounds):
+            start = time.perf_counter()
+            error = _round(env, args.processes, rng)
+            if error:
+                print('round {}: a process failed:\n{}'.format(n + 1, error))
+                return 1
+            print('round {}: {} processes, {:.2f} s'.format(
+                n + 1, args.processes, time.perf_counter() - start))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
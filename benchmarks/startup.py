@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""Startup benchmark for `ansi-scheme load` with a warm compiled-scheme cache.
+
+Runs the console entry point under `python -X importtime` in a throwaway
+XDG_DATA_HOME, subtracts the modules the bare interpreter imports anyway and
+reports the import time the command adds. Exits non-zero if that exceeds the
+budget or a module known to be slow (pkg_resources) sneaks back in.
+
+    python benchmarks/startup.py [--scheme atelier-heath] [--budget-ms 80]
+"""
+from __future__ import print_function
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FORBIDDEN = ['pkg_resources']
+ENTRY = 'from ansi_scheme.cli import cli; cli(["load"] + {!r})'
+
+
+def _importtime(code, env):
+    """Returns {module: (self_us, cumulative_us, depth)} for `code`."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                          env=env, cwd=ROOT, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE, universal_newlines=True,
+                          check=True)
+    modules = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative), depth)
+    return modules
+
+
+def _wall(code, env, runs):
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], env=env, cwd=ROOT,
+                       stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scheme', default='atelier-heath')
+    parser.add_argument('--style', default=None)
+    parser.add_argument('--budget-ms', type=float, default=80.0,
+                        help='allowed import time added by the command')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    load_args = [args.scheme] + ([args.style] if args.style else [])
+    code = ENTRY.format(load_args)
+    with tempfile.TemporaryDirectory() as xdg:
+        env = dict(os.environ, XDG_DATA_HOME=xdg, PYTHONPATH=ROOT)
+        # Warm the compiled-scheme cache (and the bytecode cache).
+        subprocess.run([sys.executable, '-c', code], env=env, cwd=ROOT,
+                       stdout=subprocess.DEVNULL, check=True)
+
+        baseline = _importtime('pass', env)
+        runs = [_importtime(code, env) for _ in range(args.runs)]
+        wall = _wall(code, env, args.runs)
+        bare = _wall('pass', env, args.runs)
+
+    def added(modules):
+        return dict((name, v) for name, v in modules.items()
+                    if name not in baseline)
+
+    totals = []
+    for modules in runs:
+        top = [v[1] for v in added(modules).values() if v[2] == 0]
+        totals.append(sum(top) / 1000.0)
+    best = min(totals)
+    modules = added(runs[totals.index(best)])
+
+    print('load {}: +{:.1f} ms imports (budget {:.1f} ms), '
+          '{:.1f} ms wall ({:.1f} ms bare interpreter)'
+          .format(' '.join(load_args), best, args.budget_ms,
+                  wall * 1000, bare * 1000))
+    print('slowest top-level imports:')
+    top = sorted(((v[1], name) for name, v in modules.items() if v[2] == 0),
+                 reverse=True)
+    for cumulative, name in top[:8]:
+        print('  {:>8.1f} ms  {}'.format(cumulative / 1000.0, name))
+
+    failed = False
+    for name in FORBIDDEN:
+        if name in modules:
+            print('FAIL: {} is imported'.format(name))
+            failed = True
+    if best > args.budget_ms:
+        print('FAIL: import time over budget')
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -12,7 +12,13 @@ setup(
             'ansi-scheme = ansi_scheme.cli:cli'
         ]
       },
+    extras_require={
+        # `ansi-scheme generate --from-image`
+        'image': ['Pillow', 'numpy']
+    },
     package_data={
-        'ansi_scheme': ['default-schemes/*.colors']
-    }
+        'ansi_scheme': ['default-schemes/*.ansischeme']
+    },
+    # Package schemes are read straight from the installed directory.
+    zip_safe=False
 )
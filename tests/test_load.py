@@ -0,0 +1,59 @@
+"""A warm `load` sends its whole output with one os.write."""
+import os
+import sys
+
+from ansi_scheme.cli import cli
+
+
+def _load(monkeypatch, out):
+    """Runs `load` with stdout on `out`; returns the sizes it wrote there."""
+    writes = []
+    real = os.write
+
+    def write(fd, data):
+        if fd == out.fileno():
+            writes.append(len(data))
+        return real(fd, data)
+    monkeypatch.setattr(sys, 'stdout', out)
+    with monkeypatch.context() as m:
+        m.setattr(os, 'write', write)
+        cli.main(['load', '--no-broadcast', 'default', 'dark'],
+                 standalone_mode=False)
+    return writes
+
+
+def test_warm_load_writes_once(tmp_path, monkeypatch):
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path / 'data'))
+    monkeypatch.delenv('TMUX', raising=False)
+    monkeypatch.setenv('TERM', 'xterm-256color')
+    with open(str(tmp_path / 'out'), 'w') as out:
+        _load(monkeypatch, out)  # compiles and caches
+        writes = _load(monkeypatch, out)
+        warm = _load(monkeypatch, out)
+    assert len(writes) == 1
+    assert warm == writes
+    assert os.path.getsize(str(tmp_path / 'out')) == 3 * writes[0]
+
+
+def test_warm_tty_load_reads_cache_once(tmp_path, monkeypatch):
+    import pty
+    from ansi_scheme import cache
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path / 'data'))
+    monkeypatch.delenv('TMUX', raising=False)
+    monkeypatch.setenv('TERM', 'xterm-256color')
+    master, slave = pty.openpty()
+    reads = []
+    real = cache._read
+
+    def read(entry_path):
+        reads.append(entry_path)
+        return real(entry_path)
+    monkeypatch.setattr(cache, '_read', read)
+    try:
+        with os.fdopen(slave, 'w') as out:
+            _load(monkeypatch, out)  # compiles and caches
+            del reads[:]
+            _load(monkeypatch, out)
+    finally:
+        os.close(master)
+    assert len(reads) == 1
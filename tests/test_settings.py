@@ -0,0 +1,36 @@
+"""Concurrent `save_settings` calls keep settings.json whole and lose no
+update."""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCESSES = 8
+SAVES = 25
+# Each writer owns one key and saves it SAVES times, one value at a time.
+WRITER = '''from ansi_scheme.user import User
+user = User()
+for n in range({saves}):
+    user.settings['writer-{key}'] = n
+    user.save_settings()
+'''
+
+
+def test_concurrent_writers(tmp_path):
+    env = dict(os.environ, XDG_DATA_HOME=str(tmp_path), PYTHONPATH=ROOT)
+    procs = [subprocess.Popen([sys.executable, '-c',
+                               WRITER.format(saves=SAVES, key=key)],
+                              env=env, stderr=subprocess.PIPE)
+             for key in range(PROCESSES)]
+    errors = [p.communicate()[1] for p in procs]
+    assert [p.returncode for p in procs] == [0] * PROCESSES, errors
+
+    data_dir = tmp_path / 'ansi-scheme'
+    with open(str(data_dir / 'settings.json')) as f:
+        settings = json.load(f)
+    for key in range(PROCESSES):
+        assert settings['writer-{}'.format(key)] == SAVES - 1
+    assert settings['scheme_name'] == 'default'
+    assert not [name for name in os.listdir(str(data_dir))
+                if name.endswith('.tmp')]
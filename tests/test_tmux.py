@@ -0,0 +1,42 @@
+"""`ansi-scheme tmux` against a throwaway tmux server."""
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from ansi_scheme.cli import cli
+
+pytestmark = pytest.mark.skipif(shutil.which('tmux') is None,
+                                reason='tmux is not installed')
+
+
+@pytest.fixture
+def server():
+    """Starts a server with one window of three panes; yields its name."""
+    name = 'ansi-scheme-test-{}'.format(os.getpid())
+    tmux = ['tmux', '-L', name, '-f', os.devnull]
+    subprocess.check_call(tmux + ['new-session', '-d', '-x', '80', '-y',
+                                  '24'])
+    try:
+        subprocess.check_call(tmux + ['split-window', '-d'])
+        subprocess.check_call(tmux + ['split-window', '-d'])
+        yield name
+    finally:
+        subprocess.call(tmux + ['kill-server'])
+
+
+def test_tmux_status(server, tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv('XDG_DATA_HOME', str(tmp_path / 'data'))
+    cli.main(['tmux', '-L', server, '--status', 'atelier-heath', 'dark'],
+             standalone_mode=False)
+    assert 'Loaded in 3 of 3 panes.' in capsys.readouterr().err
+
+    from ansi_scheme.render import render
+    conf, _ = render(str(tmp_path / 'data' / 'ansi-scheme'), 'tmux',
+                     'atelier-heath', 'dark')
+    expected = [line.split('"')[1] for line in conf.decode().splitlines()
+                if line.startswith('set -g status-style ')]
+    shown = subprocess.check_output(['tmux', '-L', server, 'show-options',
+                                     '-gv', 'status-style'])
+    assert [shown.decode().strip()] == expected, shown